@@ -8,13 +8,15 @@ import os
 import sys
 import json
 import logging
+import signal
+import traceback
 import asyncio
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from bot import OneDriveBot
+from telegram import Bot, Update
+from telegram.ext import Application
+from bot import OneDriveBot, stop_queue_logging, uvloop_loop_factory
 from database import db_manager
 from aiohttp import web
 from aiohttp.web_request import Request
@@ -62,9 +64,13 @@ class OneDriveBotRender(OneDriveBot):
         # No SSL configuration needed - Render handles HTTPS automatically
         self.web_app = None
         self.application = None  # Initialize to None, will be set up later
+        self._shutdown_event = None  # Created in run_webhook so it binds to the running loop
+        self._app_started = False  # True between application.start() and application.stop()
+        self._stopped_by_signal = False  # Set when SIGINT/SIGTERM/SIGHUP triggers shutdown
         
         # Keep-alive mechanism for long-running operations
         self.keepalive_enabled = True
+        self._keepalive_task = None
         self.last_activity = datetime.now(timezone.utc)
         
         # Check Git integration availability
@@ -112,8 +118,6 @@ class OneDriveBotRender(OneDriveBot):
             
             # For webhook mode, we need to create the application without an updater
             # This bypasses the problematic Updater creation that's causing the error
-            from telegram import Bot
-            from telegram.ext import Application
             
             # Create bot instance
             bot = Bot(token=self.token)
@@ -124,19 +128,10 @@ class OneDriveBotRender(OneDriveBot):
             
             # Add handlers
             logger.info("Adding command handlers...")
-            self.application.add_handler(CommandHandler("start", self.start_command))
-            self.application.add_handler(CommandHandler("menu", self.menu_command))
-            self.application.add_handler(CommandHandler("help", self.help_command))
-            self.application.add_handler(CommandHandler("about", self.about_command))
-            self.application.add_handler(CommandHandler("privacy", self.privacy_command))
-            self.application.add_handler(CommandHandler("feedback", self.feedback_command))
-            self.application.add_handler(CommandHandler("admin", self.admin_command))
-            self.application.add_handler(CallbackQueryHandler(self.button_callback))
-            self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_feedback_message))
+            self._register_handlers()
             logger.info("All handlers added successfully")
             
             # Set startup time and cold start detection
-            from datetime import datetime, timezone
             self.startup_time = datetime.now(timezone.utc)
             self.is_cold_start = True  # Flag to detect first interaction after startup
             self.pending_updates = []  # Queue for updates received during cold start
@@ -160,7 +155,6 @@ class OneDriveBotRender(OneDriveBot):
             
         except Exception as e:
             logger.error(f"Error setting up application: {e}")
-            import traceback
             traceback.print_exc()
             return False
         
@@ -185,7 +179,6 @@ class OneDriveBotRender(OneDriveBot):
             
         except Exception as e:
             logger.error(f"Error processing webhook: {e}")
-            import traceback
             traceback.print_exc()
             return web.Response(text="Error", status=500)
     
@@ -294,7 +287,6 @@ class OneDriveBotRender(OneDriveBot):
             
         except Exception as e:
             logger.error(f"Health check failed: {e}")
-            import traceback
             error_details = traceback.format_exc()
             
             error_response = {
@@ -539,6 +531,26 @@ class OneDriveBotRender(OneDriveBot):
             logger.error(f"Error removing webhook: {e}")
             return False
     
+    def _install_signal_handlers(self):
+        """Route SIGINT/SIGTERM/SIGHUP to the shutdown event so cleanup runs on the loop"""
+        loop = asyncio.get_running_loop()
+        signals = [signal.SIGINT, signal.SIGTERM]
+        if hasattr(signal, 'SIGHUP'):
+            signals.append(signal.SIGHUP)
+        
+        for sig in signals:
+            try:
+                loop.add_signal_handler(sig, self._request_shutdown, sig)
+            except NotImplementedError:
+                # Windows event loops do not support add_signal_handler
+                signal.signal(sig, lambda signum, _frame: loop.call_soon_threadsafe(self._request_shutdown, signum))
+    
+    def _request_shutdown(self, sig):
+        """Signal handler: remember the shutdown came from a signal and wake run_webhook"""
+        logger.info(f"Received {signal.Signals(sig).name}, shutting down...")
+        self._stopped_by_signal = True
+        self._shutdown_event.set()
+        
     async def run_webhook(self):
         """Run bot with webhook method on Render"""
         runner = None
@@ -556,6 +568,7 @@ class OneDriveBotRender(OneDriveBot):
             
             logger.info("Starting Telegram application...")
             await self.application.start()
+            self._app_started = True
             
             # Send startup notification to admin only
             try:
@@ -630,40 +643,72 @@ class OneDriveBotRender(OneDriveBot):
             logger.info(f"💚 Health check: {self.webhook_url}/health")
             logger.info("🚀 Bot is ready to receive requests!")
             
-            # Keep the server running
-            try:
-                while True:
-                    await asyncio.sleep(1)
-            except KeyboardInterrupt:
-                logger.info("Shutting down webhook server...")
+            # Keep the server running until a shutdown signal arrives
+            self._shutdown_event = asyncio.Event()
+            self._install_signal_handlers()
+            
+            await self._shutdown_event.wait()
+            logger.info("Shutting down webhook server...")
             
         except Exception as e:
             logger.error(f"Error running webhook: {e}")
-            import traceback
             traceback.print_exc()
             raise
         finally:
             # Cleanup
             logger.info("Starting cleanup...")
-            try:
-                if hasattr(self, 'application') and self.application:
-                    logger.info("Removing webhook...")
-                    await self.remove_webhook()
-                    logger.info("Stopping application...")
-                    await self.application.stop()
-                    logger.info("Shutting down application...")
-                    await self.application.shutdown()
+            
+            async def unregister_webhook():
+                """Stop Telegram from sending updates, unless a newer instance owns the webhook"""
+                if self.application is None:
+                    return
+                if self._stopped_by_signal:
+                    # On a zero-downtime deploy the new instance has already registered the same
+                    # webhook URL before this one gets SIGTERM; deleting it would cut off updates
+                    logger.info("Signal-driven shutdown, leaving webhook registered")
+                    return
+                logger.info("Removing webhook...")
+                await self.remove_webhook()
+            
+            async def stop_web_server():
+                """Stop accepting webhook requests"""
                 if runner:
                     logger.info("Cleaning up web runner...")
                     await runner.cleanup()
-                logger.info("Cleanup completed")
-            except Exception as e:
-                logger.error(f"Error during cleanup: {e}")
+            
+            async def stop_application():
+                """Stop and shut down the application so no handler runs after this"""
+                if self.application is None:
+                    return
+                if self._app_started:
+                    logger.info("Stopping application...")
+                    await self.application.stop()
+                    self._app_started = False
+                logger.info("Shutting down application...")
+                await self.application.shutdown()
+            
+            # Steps run in order: nothing may dispatch updates (and schedule deletes or reopen
+            # the HTTP session) once deletes are cancelled; one failing does not skip the rest
+            for step in (
+                self.stop_keepalive_task,
+                unregister_webhook,
+                stop_web_server,
+                stop_application,
+                self.cancel_pending_deletes,
+                self.wait_for_cache_stores,
+                self.close_http_session,
+            ):
+                try:
+                    await step()
+                except Exception as e:
+                    logger.error(f"Error during cleanup: {e}")
+            logger.info("Cleanup completed")
+            stop_queue_logging()
     
     def run(self):
         """Run bot (webhook mode only for Render)"""
         try:
-            asyncio.run(self.run_webhook())
+            asyncio.run(self.run_webhook(), loop_factory=uvloop_loop_factory())
         except KeyboardInterrupt:
             logger.info("Bot stopped by user")
         except Exception as e:
@@ -859,7 +904,6 @@ class OneDriveBotRender(OneDriveBot):
             
         except Exception as e:
             logger.error(f"Error processing webhook update: {e}")
-            import traceback
             traceback.print_exc()
 
     async def process_pending_updates(self):
@@ -883,9 +927,6 @@ class OneDriveBotRender(OneDriveBot):
                     await self.send_ready_notification(user_id)
                     notified_users.add(user_id)
             
-            # Small delay to let users see the ready message
-            await asyncio.sleep(1)
-            
             # Process the queued updates
             for update_data in self.pending_updates:
                 try:
@@ -954,9 +995,19 @@ class OneDriveBotRender(OneDriveBot):
                     await asyncio.sleep(60)  # Wait a minute before retrying
         
         # Start the keep-alive task
-        asyncio.create_task(keepalive_loop())
+        self._keepalive_task = asyncio.create_task(keepalive_loop())
         logger.info("Keep-alive task started - will ping every 10 minutes to prevent sleep")
     
+    async def stop_keepalive_task(self):
+        """Cancel the keep-alive task and wait for it to finish"""
+        self.keepalive_enabled = False
+        task, self._keepalive_task = self._keepalive_task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info("Keep-alive task stopped")
+    
     async def self_ping_health_endpoint(self):
         """Self-ping the health endpoint to maintain activity and prevent sleep"""
         try:
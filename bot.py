@@ -1,17 +1,35 @@
 import os
-import json
+import queue
+import atexit
+import hashlib
+import functools
 import logging
+import time
 import asyncio
-import requests
+import tempfile
 import aiohttp
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+import orjson
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Dict, List, Optional, Any, Tuple
+from aiolimiter import AsyncLimiter
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Document
+from telegram.error import RetryAfter
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from indexer import OneDriveIndexer
+from indexer import DOWNLOAD_URL_TTL, OneDriveIndexer
 from database import db_manager
 
+# Optional faster event loop (not available on Windows)
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    uvloop = None
+    UVLOOP_AVAILABLE = False
+
 # Import AUST Notice Checker
 try:
     from aust_notices import AustNoticeChecker
@@ -39,6 +57,236 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def _install_queue_logging() -> QueueListener:
+    """Route root log records through a queue so handlers format and write off the event loop"""
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    log_queue = queue.Queue(-1)
+    root.addHandler(QueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_queue_logging)
+    return listener
+
+
+def stop_queue_logging():
+    """Flush queued log records and log directly from then on; safe to call more than once"""
+    root = logging.getLogger()
+    queue_handlers = [handler for handler in root.handlers if isinstance(handler, QueueHandler)]
+    if not queue_handlers:
+        return
+    for handler in queue_handlers:
+        root.removeHandler(handler)
+    log_listener.stop()
+    # Anything logged after shutdown (e.g. "Bot stopped") goes straight to the real handlers
+    for handler in log_listener.handlers:
+        root.addHandler(handler)
+
+
+log_listener = _install_queue_logging()
+
+
+def uvloop_loop_factory():
+    """Loop factory for asyncio.run(): uvloop when available, else the default loop"""
+    if not UVLOOP_AVAILABLE:
+        return None
+    logger.info("Using uvloop event loop")
+    return uvloop.new_event_loop
+
+
+def install_uvloop() -> bool:
+    """Install uvloop as the event loop policy if available; call before the loop is created"""
+    if not UVLOOP_AVAILABLE:
+        return False
+    # uvloop.install() is deprecated on Python 3.12; set the policy directly
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop event loop")
+    return True
+
+
+# Plain text messages (feedback, mass message, add user input); built once and shared
+_TEXT_NOT_COMMAND = filters.TEXT & ~filters.COMMAND
+
+# Maximum number of long callback payloads kept for button resolution
+CALLBACK_MAP_MAX_SIZE = 10000
+
+# Pending text-input prompts (feedback, mass message, add user) expire after this many seconds
+AWAITING_INPUT_TTL = 600
+AWAITING_INPUT_MAX_SIZE = 10000
+
+# Registered users listed per page in the admin user view
+USERS_PAGE_SIZE = 20
+
+# Broadcast fan-out: concurrent sends and messages per second (Telegram allows ~30/s)
+BROADCAST_CONCURRENCY = 25
+BROADCAST_RATE_PER_SECOND = 25
+
+# Retries per recipient when Telegram answers a broadcast send with flood control (429)
+BROADCAST_MAX_RETRIES = 2
+
+# Send errors that mean the user is gone for good; other Forbidden errors (e.g. "bot can't
+# initiate conversation" for manually added users who never started the bot) keep the user
+INACTIVE_USER_ERRORS = ("bot was blocked", "user is deactivated")
+
+# Download links cached per file id (for DOWNLOAD_URL_TTL, shared with the indexer)
+DOWNLOAD_URL_CACHE_MAX_SIZE = 2048
+
+# Responses meaning a cached pre-authenticated download URL is expired or revoked
+STALE_DOWNLOAD_URL_STATUSES = (401, 403, 404)
+
+# Downloads larger than this spill from memory to a temporary file on disk
+DOWNLOAD_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Read size for streamed downloads; small reads throttle throughput on fast links
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Files larger than one part are fetched as parallel HTTP Range requests
+RANGE_PART_SIZE = 4 * 1024 * 1024
+RANGE_DOWNLOAD_CONCURRENCY = 4
+
+# Index rebuild progress messages are edited at most this often (seconds)
+PROGRESS_UPDATE_INTERVAL = 2
+
+# All eleven 10-cell progress bars (0% to 100% in 10% steps), indexed by filled cells
+_PROGRESS_BARS = tuple("█" * filled + "░" * (10 - filled) for filled in range(11))
+
+# Partitioned folder listings are reused across page flips for this many seconds
+FOLDER_CACHE_TTL = 60
+FOLDER_CACHE_MAX_SIZE = 1024
+
+# Rendered folder pages (text and keyboard) per (path, page, is_admin), same TTL as listings
+FOLDER_PAGE_CACHE_MAX_SIZE = 256
+
+# Telegram file_ids of already uploaded documents, keyed by (OneDrive item id, last modified)
+SENT_FILE_CACHE_MAX_SIZE = 4096
+
+# Local copies of downloaded files, keyed by (item id, last modified); oldest evicted past the size cap
+FILE_CACHE_DIR = "filecache"
+FILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Dot-prefixed temp copies older than this are leftovers from an interrupted write
+FILE_CACHE_STALE_TEMP_AGE = 15 * 60
+
+
+@functools.lru_cache(maxsize=4096)
+def _split_path(path: str) -> Tuple[str, str, str]:
+    """Split a folder path into (parent path, display name, prefix for child paths)"""
+    if path == "root":
+        return "root", "Sharing", ""
+    parent, _, leaf = path.rpartition("/")
+    return parent or "root", leaf, path + "/"
+
+
+@functools.lru_cache(maxsize=CALLBACK_MAP_MAX_SIZE)
+def _encode_callback_data(prefix: str, data: str) -> Tuple[str, bool]:
+    """Encode button callback data, returning (callback data, whether it was hashed to fit 64 bytes)"""
+    full_data = f"{prefix}_{data}"
+    encoded = full_data.encode('utf-8')
+    
+    # If data is short enough, use it directly
+    if len(encoded) <= 64:
+        return full_data, False
+    
+    # Otherwise use a short deterministic hash of the data
+    return f"{prefix}_{hashlib.blake2b(encoded, digest_size=6).hexdigest()}", True
+
+
+def _is_inactive_user_error(error: Exception) -> bool:
+    """Whether a send error means the user blocked the bot or deleted their account"""
+    message = str(error).lower()
+    return any(reason in message for reason in INACTIVE_USER_ERRORS)
+
+
+def _file_cache_key(item_id: str, modified: str) -> str:
+    """Filesystem-safe cache file name for a OneDrive item version"""
+    return hashlib.blake2b(f"{item_id}:{modified}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _build_main_menu_markup(is_admin: bool) -> InlineKeyboardMarkup:
+    """Build the main menu keyboard; admins also get refresh and admin panel buttons"""
+    keyboard = [
+        [InlineKeyboardButton("📁 Browse Files", callback_data="browse_root")]
+    ]
+    
+    # Add refresh index button only for admin
+    if is_admin:
+        keyboard.append([InlineKeyboardButton("🔄 Refresh Index", callback_data="refresh_index")])
+        
+    # Add information and admin buttons
+    keyboard.extend([
+        [InlineKeyboardButton("❓ Help", callback_data="show_help"),
+         InlineKeyboardButton("ℹ️ About", callback_data="show_about")],
+        [InlineKeyboardButton("🔒 Privacy", callback_data="show_privacy"),
+         InlineKeyboardButton("📝 Feedback", callback_data="show_feedback")]
+    ])
+    
+    if is_admin:
+        keyboard.append([InlineKeyboardButton("⚙️ Admin Panel", callback_data="show_admin")])
+        
+    return InlineKeyboardMarkup(keyboard)
+
+
+# Static keyboards are immutable, so build them once and reuse them for every update
+MAIN_MENU_MARKUPS = {is_admin: _build_main_menu_markup(is_admin) for is_admin in (False, True)}
+
+BACK_TO_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]])
+
+FEEDBACK_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📝 Submit Feedback", callback_data="submit_feedback")],
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
+])
+
+ADMIN_PANEL_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Rebuild Index", callback_data="admin_rebuild")],
+    [InlineKeyboardButton("👥 Manage Users", callback_data="admin_users")],
+    [InlineKeyboardButton("📢 Send Mass Message", callback_data="admin_mass_message")],
+    [InlineKeyboardButton("📝 View Feedback", callback_data="admin_feedback")],
+    [InlineKeyboardButton("📊 Bot Stats", callback_data="admin_stats")],
+    [InlineKeyboardButton("🛑 Shutdown Bot", callback_data="admin_shutdown")],
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
+])
+
+BACK_TO_ADMIN_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
+    [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
+])
+
+# /admin shows a shorter panel than the inline admin screen
+ADMIN_COMMAND_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Rebuild Index", callback_data="admin_rebuild")],
+    [InlineKeyboardButton("👥 Manage Users", callback_data="admin_users")],
+    [InlineKeyboardButton("📊 Bot Stats", callback_data="admin_stats")],
+    [InlineKeyboardButton("🛑 Shutdown Bot", callback_data="admin_shutdown")],
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
+])
+
+USER_MANAGEMENT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👀 View All Users", callback_data="admin_view_users")],
+    [InlineKeyboardButton("➕ Add User Manually", callback_data="admin_add_user")],
+    [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
+    [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
+])
+
+USER_ADDED_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👥 User Management", callback_data="admin_users")],
+    [InlineKeyboardButton("🔙 Admin Panel", callback_data="show_admin")]
+])
+
+ADD_USER_RETRY_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Try Again", callback_data="admin_add_user")],
+    [InlineKeyboardButton("👥 User Management", callback_data="admin_users")]
+])
+
+# Cancel buttons for the text-input prompts, keyed by the screen they return to
+CANCEL_MARKUPS = {
+    callback: InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=callback)]])
+    for callback in ("show_feedback", "show_admin", "admin_users")
+}
+
 # AI features removed - keeping bot lightweight and focused
 
 class OneDriveBot:
@@ -47,23 +295,21 @@ class OneDriveBot:
         try:
             # Update last_activity if present (for Render deployment)
             if hasattr(self, 'last_activity'):
-                from datetime import datetime, timezone
                 self.last_activity = datetime.now(timezone.utc)
                 logger.debug("Keep-alive: Updated last_activity timestamp")
             
             # If we have a webhook URL (Render deployment), self-ping the health endpoint
             if hasattr(self, 'webhook_url') and self.webhook_url:
                 try:
-                    import aiohttp
                     health_url = f"{self.webhook_url}/ping"
                     
                     timeout = aiohttp.ClientTimeout(total=5)
-                    async with aiohttp.ClientSession(timeout=timeout) as session:
-                        async with session.get(health_url) as response:
-                            if response.status == 200:
-                                logger.debug(f"Keep-alive: Self-ping successful to {health_url}")
-                            else:
-                                logger.warning(f"Keep-alive: Self-ping failed with status {response.status}")
+                    session = await self.get_http_session()
+                    async with session.get(health_url, timeout=timeout) as response:
+                        if response.status == 200:
+                            logger.debug(f"Keep-alive: Self-ping successful to {health_url}")
+                        else:
+                            logger.warning(f"Keep-alive: Self-ping failed with status {response.status}")
                 except Exception as ping_error:
                     logger.debug(f"Keep-alive: Self-ping error (normal during operations): {ping_error}")
             
@@ -73,10 +319,8 @@ class OneDriveBot:
                 if hasattr(self.indexer, 'is_indexing') and self.indexer.is_indexing:
                     # Send a silent keep-alive message to admin every 5 minutes during indexing
                     if not hasattr(self, '_last_admin_ping'):
-                        from datetime import datetime, timezone
                         self._last_admin_ping = datetime.now(timezone.utc)
                     
-                    from datetime import datetime, timezone, timedelta
                     now = datetime.now(timezone.utc)
                     if (now - self._last_admin_ping) > timedelta(minutes=5):
                         try:
@@ -144,17 +388,56 @@ class OneDriveBot:
             folder_config=folder_config
         )
         
+        # Shared HTTP session for Graph downloads (created lazily inside the event loop)
+        self.http_session = None
+        
+        # Graph driveItem URL prefix and (token, Authorization headers), built once instead of per request
+        self._graph_items_url = f"https://graph.microsoft.com/v1.0/users/{self.indexer.target_user_id}/drive/items/"
+        self._auth_headers = (None, {})
+        
+        # Bounded concurrency and rate limiting for broadcasts to subscribers
+        self._send_sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        self._send_limiter = AsyncLimiter(BROADCAST_RATE_PER_SECOND, 1)
+        
+        # Background startup notification (polling mode), cancelled on shutdown if still running
+        self._startup_notify_task = None
+        
+        # Scheduled message deletions, tracked so they are not GC'd and can be cancelled on shutdown
+        self._pending_deletes = set()
+        
+        # Disk-cache copies of sent downloads, written after the user is answered; awaited on shutdown
+        self._cache_store_tasks = set()
+        
+        # Held across snapshot and write so overlapping saves land on disk in call order
+        self._save_lock = asyncio.Lock()
+        
+        # file_id -> pre-authenticated download URL, expiring before Graph's does; Range downloads use it too
+        self._dl_url_cache = TTLCache(maxsize=DOWNLOAD_URL_CACHE_MAX_SIZE, ttl=DOWNLOAD_URL_TTL)
+        # file_id -> createLink sharing page, for files Graph gave no download URL (not fetchable content)
+        self._share_link_cache = TTLCache(maxsize=DOWNLOAD_URL_CACHE_MAX_SIZE, ttl=DOWNLOAD_URL_TTL)
+        
+        # path -> (folders + files, folder count, file count), cleared whenever the index changes
+        self._folder_cache = TTLCache(maxsize=FOLDER_CACHE_MAX_SIZE, ttl=FOLDER_CACHE_TTL)
+        self._folder_page_cache = TTLCache(maxsize=FOLDER_PAGE_CACHE_MAX_SIZE, ttl=FOLDER_CACHE_TTL)
+        
+        # (item id, modified) -> Telegram file_id, so repeat requests skip the download and upload
+        self._sent_file_ids = LRUCache(maxsize=SENT_FILE_CACHE_MAX_SIZE)
+        
+        # Back-to-folder keyboards keyed by callback data, reused across error and fallback screens
+        self._back_markup_cache = LRUCache(maxsize=1024)
+        
         # Callback data mapping to handle long file names (max 64 bytes for Telegram)
-        self.callback_map = {}
-        self.callback_counter = 0
+        # Keys are content hashes, so identical paths share one entry; the map is LRU-bounded
+        self.callback_map = OrderedDict()
         
         # User and data management
         self.unlimited_users = set()
         
         # Feedback collection state
-        self.awaiting_feedback = set()  # Track users who are providing feedback
-        self.awaiting_mass_message = set()  # Track admins providing mass message
-        self.awaiting_add_user = set()  # Track admin adding users manually
+        # TTL-bounded so abandoned prompts expire instead of accumulating
+        self.awaiting_feedback = TTLCache(maxsize=AWAITING_INPUT_MAX_SIZE, ttl=AWAITING_INPUT_TTL)  # Track users who are providing feedback
+        self.awaiting_mass_message = TTLCache(maxsize=AWAITING_INPUT_MAX_SIZE, ttl=AWAITING_INPUT_TTL)  # Track admins providing mass message
+        self.awaiting_add_user = TTLCache(maxsize=AWAITING_INPUT_MAX_SIZE, ttl=AWAITING_INPUT_TTL)  # Track admin adding users manually
         
         # Database integration for data persistence
         if db_manager.enabled:
@@ -162,6 +445,38 @@ class OneDriveBot:
         else:
             logger.info("Database not available - using fallback file storage")
         
+        # Bot commands, dispatched by a single CommandHandler
+        self._command_map = {
+            "start": self.start_command,
+            "menu": self.menu_command,
+            "help": self.help_command,
+            "about": self.about_command,
+            "privacy": self.privacy_command,
+            "feedback": self.feedback_command,
+            "admin": self.admin_command
+        }
+        
+        # Button callbacks: exact callback data first, then by the prefix before the first "_"
+        self._callback_handlers = {
+            "browse_root": self._browse_root,
+            "refresh_index": self.refresh_index,
+            "main_menu": self.show_main_menu,
+            "show_help": self.show_help_inline,
+            "show_about": self.show_about_inline,
+            "show_privacy": self.show_privacy_inline,
+            "show_feedback": self.show_feedback_inline,
+            "submit_feedback": self.start_feedback_collection,
+            "show_admin": self.show_admin_inline
+        }
+        self._callback_prefix_handlers = {
+            "page": self._on_page_callback,
+            "folder": self._on_folder_callback,
+            "back": self._on_folder_callback,
+            "file": self._on_file_callback,
+            "download": self._on_download_callback,
+            "admin": self._on_admin_callback
+        }
+        
         # Track bot startup time for pending message handling
         self.startup_time = None
         
@@ -198,84 +513,233 @@ class OneDriveBot:
             else:
                 # Fallback to file loading
                 if os.path.exists('unlimited_users.json'):
-                    with open('unlimited_users.json', 'r') as f:
-                        self.unlimited_users = set(json.load(f))
+                    with open('unlimited_users.json', 'rb') as f:
+                        self.unlimited_users = set(orjson.loads(f.read()))
                     logger.info(f"Loaded {len(self.unlimited_users)} users from file (fallback)")
         except Exception as e:
             logger.error(f"Error loading data: {e}")
 
-    def save_data(self):
+    async def save_data(self):
         """Save data to database or fallback to files"""
         try:
             if db_manager.enabled:
                 # Database automatically saves data, no need to explicitly save user list
                 logger.debug("Using database - no manual save needed")
             else:
-                # Fallback to file saving
-                with open('unlimited_users.json', 'w') as f:
-                    json.dump(list(self.unlimited_users), f)
+                # Fallback to file saving; serialize here, write off the event loop
+                async with self._save_lock:
+                    payload = orjson.dumps(list(self.unlimited_users))
+                    await asyncio.to_thread(self._write_users_file, payload)
                 logger.info("Saved user data to file (fallback)")
         except Exception as e:
             logger.error(f"Error saving data: {e}")
 
-    def save_unlimited_users(self):
+    @staticmethod
+    def _write_users_file(payload: bytes):
+        """Write serialized user list to the fallback file"""
+        with open('unlimited_users.json', 'wb') as f:
+            f.write(payload)
+
+    async def save_unlimited_users(self):
         """Save unlimited users to database or file - convenience method"""
-        self.save_data()
+        await self.save_data()
 
     def get_folder_contents(self, path: str = 'root') -> List[Dict]:
         """Get folder contents from indexer"""
         return self.indexer.get_folder_contents(path)
 
-    async def download_file_async(self, file_id: str) -> Optional[bytes]:
-        """Download file from OneDrive asynchronously using aiohttp"""
-        token = self.indexer.get_access_token()
+    def get_folder_listing(self, path: str = 'root') -> Tuple[List[Dict], int, int]:
+        """Get folder contents as (folders then files, folder count, file count), cached per path"""
+        listing = self._folder_cache.get(path)
+        if listing is None:
+            folders = []
+            files = []
+            # Partition in a single pass; every item is either a folder or a file
+            for item in self.get_folder_contents(path):
+                (folders if item['type'] == 'folder' else files).append(item)
+            listing = (folders + files, len(folders), len(files))
+            self._folder_cache[path] = listing
+        return listing
+
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """Get the shared aiohttp session, creating it on first use"""
+        if self.http_session is None or self.http_session.closed:
+            # Keep connections to Graph warm and cache its DNS answers between clicks
+            connector = aiohttp.TCPConnector(
+                limit=20,
+                limit_per_host=10,
+                ttl_dns_cache=300,
+                keepalive_timeout=75
+            )
+            self.http_session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=300)
+            )
+        return self.http_session
+
+    def _graph_headers(self, token: str) -> Dict[str, str]:
+        """Authorization headers for Graph, rebuilt only when the token changes (do not mutate)"""
+        if self._auth_headers[0] != token:
+            self._auth_headers = (token, {"Authorization": f"Bearer {token}"})
+        return self._auth_headers[1]
+
+    async def close_http_session(self):
+        """Close the shared aiohttp session"""
+        if self.http_session and not self.http_session.closed:
+            await self.http_session.close()
+        self.http_session = None
+
+    async def download_file_async(self, file_id: str, size: int = 0) -> Optional[IO[bytes]]:
+        """Stream a OneDrive file into a spooled temp file; the caller must close it"""
+        token = await self.indexer.get_access_token_async()
         if not token:
             return None
             
         try:
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"https://graph.microsoft.com/v1.0/users/{self.indexer.target_user_id}/drive/items/{file_id}/content"
+            headers = self._graph_headers(token)
+            url = f"{self._graph_items_url}{file_id}/content"
             
+            session = await self.get_http_session()
             timeout = aiohttp.ClientTimeout(total=300)  # 5 minute timeout
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        return await response.read()
-                    else:
+            spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_SIZE)
+            try:
+                if size > RANGE_PART_SIZE:
+                    # Parts go straight to the pre-authenticated URL: one Graph call per file, not per part
+                    content_url = await self._resolve_content_url(session, file_id, headers)
+                    if content_url and await self._download_ranges(session, file_id, content_url, size, spool, timeout):
+                        spool.seek(0)
+                        return spool
+                
+                # Small file, or the server ignored Range: fall back to a single stream
+                spool.seek(0)
+                spool.truncate()
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    if response.status != 200:
                         logger.error(f"HTTP {response.status} error downloading file {file_id}")
+                        spool.close()
+                        return None
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        spool.write(chunk)
+                spool.seek(0)
+                return spool
+            except BaseException:
+                spool.close()
+                raise
         except asyncio.TimeoutError:
             logger.error(f"Timeout downloading file {file_id}")
         except Exception as e:
             logger.error(f"Error downloading file {file_id}: {e}")
         return None
 
-    def download_file(self, file_id: str) -> Optional[bytes]:
-        """Download file from OneDrive using indexer's token (legacy sync method)"""
-        token = self.indexer.get_access_token()
-        if not token:
-            return None
-            
+    async def _resolve_content_url(self, session, file_id: str, headers: Dict[str, str]) -> Optional[str]:
+        """Get a file's pre-authenticated download URL, asking Graph only when no cached one is valid"""
+        cached = self._dl_url_cache.get(file_id) or self.indexer.get_cached_download_url(file_id)
+        if cached:
+            return cached
+        
+        # /content answers with a 302 to the pre-authenticated URL; read it without following
+        url = f"{self._graph_items_url}{file_id}/content"
+        async with session.get(url, headers=headers, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            location = response.headers.get("Location") if response.status in (301, 302, 303, 307) else None
+        if location:
+            self._dl_url_cache[file_id] = location
+        return location
+
+    def _evict_download_url(self, file_id: str):
+        """Forget a download URL that Graph no longer honours so the next download resolves a fresh one"""
+        self._dl_url_cache.pop(file_id, None)
+        self.indexer.invalidate_download_url(file_id)
+
+    async def _download_ranges(self, session, file_id: str, url: str, size: int, spool: IO[bytes], timeout) -> bool:
+        """Fetch a file as parallel Range requests into spool; False if ranges were not honoured"""
+        sem = asyncio.Semaphore(RANGE_DOWNLOAD_CONCURRENCY)
+        
+        async def fetch_part(start: int) -> bool:
+            end = min(start + RANGE_PART_SIZE, size) - 1
+            async with sem:
+                # Pre-authenticated URL: no Authorization header
+                range_headers = {"Range": f"bytes={start}-{end}"}
+                async with session.get(url, headers=range_headers, timeout=timeout) as response:
+                    if response.status in STALE_DOWNLOAD_URL_STATUSES:
+                        logger.info(f"Download URL for {file_id} rejected with HTTP {response.status}, evicting it")
+                        self._evict_download_url(file_id)
+                        return False
+                    # A stale size from the index would misplace parts, so check the total too
+                    if response.status != 206 or not response.headers.get("Content-Range", "").endswith(f"/{size}"):
+                        return False
+                    data = await response.read()
+            spool.seek(start)
+            spool.write(data)
+            return True
+        
+        # Probe with the first part so a server that ignores Range costs a single request
+        if not await fetch_part(0):
+            logger.info("Range download not available, falling back to a single stream")
+            return False
+        
+        # A failing part cancels its siblings before the caller closes the spool
         try:
-            import requests
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"https://graph.microsoft.com/v1.0/users/{self.indexer.target_user_id}/drive/items/{file_id}/content"
-            response = requests.get(url, headers=headers, timeout=300)
-            
-            if response.status_code == 200:
-                return response.content
-        except Exception as e:
-            logger.error(f"Error downloading file: {e}")
-        return None
+            async with asyncio.TaskGroup() as group:
+                parts = [group.create_task(fetch_part(start)) for start in range(RANGE_PART_SIZE, size, RANGE_PART_SIZE)]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0]
+        return all(part.result() for part in parts)
 
     async def notify_subscribers(self, message: str):
-        """Notify unlimited users"""
-        for user_id in self.unlimited_users:
-            try:
-                msg = await self.application.bot.send_message(chat_id=user_id, text=message)
+        """Notify unlimited users concurrently, within Telegram's rate limits"""
+        user_ids = list(self.unlimited_users)
+        results = await asyncio.gather(*(self._broadcast_send(uid, message) for uid in user_ids), return_exceptions=True)
+        
+        blocked = []
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error notifying user {user_id}: {result}")
+                if _is_inactive_user_error(result):
+                    blocked.append(user_id)
+            else:
                 # Delete message after 1 minute
-                asyncio.create_task(self._delete_message_later(user_id, msg.message_id, 60))
-            except Exception as e:
-                logger.error(f"Error notifying user {user_id}: {e}")
+                self._schedule_delete(user_id, result.message_id, 60)
+        
+        await self._remove_users(blocked)
+    
+    async def _broadcast_send(self, user_id: int, text: str):
+        """Send one broadcast message within the shared limits, backing off on flood control"""
+        for attempt in range(BROADCAST_MAX_RETRIES + 1):
+            try:
+                async with self._send_sem, self._send_limiter:
+                    return await self.application.bot.send_message(chat_id=user_id, text=text)
+            except RetryAfter as e:
+                if attempt == BROADCAST_MAX_RETRIES:
+                    raise
+                # Wait out the interval outside the semaphore so other sends keep going
+                await asyncio.sleep(e.retry_after)
+    
+    async def _remove_users(self, user_ids: List[int]):
+        """Drop users who blocked the bot or deleted their account"""
+        if not user_ids:
+            return
+        logger.info(f"Removing {len(user_ids)} inactive users from user list")
+        self.unlimited_users.difference_update(user_ids)
+        if db_manager.enabled:
+            for user_id in user_ids:
+                await asyncio.to_thread(db_manager.remove_user, user_id)
+        else:
+            await self.save_data()  # Fallback to file
+    
+    def _schedule_delete(self, chat_id: int, message_id: int, delay: int):
+        """Schedule a tracked delayed message deletion"""
+        task = asyncio.create_task(self._delete_message_later(chat_id, message_id, delay))
+        self._pending_deletes.add(task)
+        task.add_done_callback(self._pending_deletes.discard)
+    
+    async def cancel_pending_deletes(self):
+        """Cancel all scheduled message deletions and wait for them to finish"""
+        tasks = list(self._pending_deletes)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"Cancelled {len(tasks)} pending message deletions")
 
     async def _delete_message_later(self, chat_id: int, message_id: int, delay: int):
         """Delete message after delay"""
@@ -287,22 +751,48 @@ class OneDriveBot:
 
     def create_callback_data(self, prefix: str, data: str) -> str:
         """Create short callback data for Telegram buttons (max 64 bytes)"""
-        full_data = f"{prefix}_{data}"
-        
-        # If data is short enough, use it directly
-        if len(full_data.encode('utf-8')) <= 64:
-            return full_data
-            
-        # Otherwise, create a mapping
-        self.callback_counter += 1
-        short_id = f"{prefix}_{self.callback_counter}"
-        self.callback_map[short_id] = data
-        
+        short_id, hashed = _encode_callback_data(prefix, data)
+        if hashed:
+            self._remember_callbacks([(short_id, data)])
         return short_id
     
+    def _remember_callbacks(self, hashed_callbacks: List[Tuple[str, str]]):
+        """Map short deterministic hashes back to their original data"""
+        for short_id, data in hashed_callbacks:
+            self.callback_map[short_id] = data
+            self.callback_map.move_to_end(short_id)
+        
+        # Evict least recently used mappings to keep memory bounded
+        while len(self.callback_map) > CALLBACK_MAP_MAX_SIZE:
+            self.callback_map.popitem(last=False)
+    
+    def _back_to_folder_markup(self, folder_path: str) -> InlineKeyboardMarkup:
+        """Get the cached Back to Folder / Main Menu keyboard for a folder"""
+        # Always go through create_callback_data so a hashed key stays live in the callback map
+        back_callback = self.create_callback_data("folder", folder_path)
+        reply_markup = self._back_markup_cache.get(back_callback)
+        if reply_markup is None:
+            reply_markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton("⬅️ Back to Folder", callback_data=back_callback)],
+                [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
+            ])
+            self._back_markup_cache[back_callback] = reply_markup
+        return reply_markup
+    
+    def _large_file_keyboard(self, folder_path: str, download_url: Optional[str]) -> InlineKeyboardMarkup:
+        """OneDrive link / Back to Folder / Main Menu keyboard, or just the folder keyboard without a link"""
+        if not download_url:
+            return self._back_to_folder_markup(folder_path)
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔗 Download from OneDrive", url=download_url)],
+            [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", folder_path))],
+            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
+        ])
+    
     def resolve_callback_data(self, callback_data: str) -> str:
         """Resolve short callback data to original data"""
         if callback_data in self.callback_map:
+            self.callback_map.move_to_end(callback_data)
             return self.callback_map[callback_data]
         
         # If not in map, assume it's direct data (remove prefix)
@@ -335,37 +825,20 @@ class OneDriveBot:
             
             # Add to database if available
             if db_manager.enabled:
-                db_manager.add_user(
+                await asyncio.to_thread(
+                    db_manager.add_user,
                     user_id=user_id,
                     username=user.username,
                     first_name=user.first_name,
                     last_name=user.last_name
                 )
             else:
-                self.save_data()  # Fallback to file
+                await self.save_data()  # Fallback to file
                 
             logger.info(f"New user added: {user_id} (@{user.username})")
         
-        keyboard = [
-            [InlineKeyboardButton("📁 Browse Files", callback_data="browse_root")]
-        ]
-        
-        # Add refresh index button only for admin
-        if update.effective_user.id == self.admin_id:
-            keyboard.append([InlineKeyboardButton("🔄 Refresh Index", callback_data="refresh_index")])
-            
-        # Add information and admin buttons
-        keyboard.extend([
-            [InlineKeyboardButton("❓ Help", callback_data="show_help"),
-             InlineKeyboardButton("ℹ️ About", callback_data="show_about")],
-            [InlineKeyboardButton("🔒 Privacy", callback_data="show_privacy"),
-             InlineKeyboardButton("📝 Feedback", callback_data="show_feedback")]
-        ])
-        
-        if update.effective_user.id == self.admin_id:
-            keyboard.append([InlineKeyboardButton("⚙️ Admin Panel", callback_data="show_admin")])
-            
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        is_admin = user_id == self.admin_id
+        reply_markup = MAIN_MENU_MARKUPS[is_admin]
         
         welcome_text = (
             "🎓 Welcome to OneDrive Sharing Bot!\n\n"
@@ -377,7 +850,7 @@ class OneDriveBot:
         
         welcome_text += "📂 Browse and download sharing files\n"
         
-        if update.effective_user.id == self.admin_id:
+        if is_admin:
             welcome_text += "� Admin controls available\n"
             
         welcome_text += "\nSelect an option below:"
@@ -407,8 +880,7 @@ class OneDriveBot:
         # Add queued message notice if applicable
         help_text = self._add_queued_message_notice(help_text, self._was_message_queued(update))
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_MENU_MARKUP
         await update.message.reply_text(help_text, reply_markup=reply_markup)
 
     async def about_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -425,8 +897,7 @@ class OneDriveBot:
             "🔗 Powered by Microsoft Graph API"
         )
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_MENU_MARKUP
         await update.message.reply_text(about_text, reply_markup=reply_markup)
 
     async def privacy_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -448,8 +919,7 @@ class OneDriveBot:
             "📧 Contact admin for privacy concerns"
         )
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_MENU_MARKUP
         await update.message.reply_text(privacy_text, reply_markup=reply_markup)
 
     async def feedback_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -463,11 +933,7 @@ class OneDriveBot:
             "Click the button below to submit your feedback."
         )
         
-        keyboard = [
-            [InlineKeyboardButton("📝 Submit Feedback", callback_data="submit_feedback")],
-            [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = FEEDBACK_MARKUP
         await update.message.reply_text(feedback_text, reply_markup=reply_markup)
 
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -476,14 +942,7 @@ class OneDriveBot:
             await update.message.reply_text("❌ Access denied. Admin only.")
             return
 
-        keyboard = [
-            [InlineKeyboardButton("🔄 Rebuild Index", callback_data="admin_rebuild")],
-            [InlineKeyboardButton("👥 Manage Users", callback_data="admin_users")],
-            [InlineKeyboardButton("📊 Bot Stats", callback_data="admin_stats")],
-            [InlineKeyboardButton("🛑 Shutdown Bot", callback_data="admin_shutdown")],
-            [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = ADMIN_COMMAND_MARKUP
         
         await update.message.reply_text(
             "🔧 Admin Panel\n\nSelect an option:",
@@ -497,77 +956,84 @@ class OneDriveBot:
         
         data = query.data
         
-        if data == "browse_root":
-            await self.show_folder_contents(query, "root")
-        elif data == "refresh_index":
-            await self.refresh_index(query)
-        elif data == "main_menu":
-            await self.show_main_menu(query)
-        elif data == "show_help":
-            await self.show_help_inline(query)
-        elif data == "show_about":
-            await self.show_about_inline(query)
-        elif data == "show_privacy":
-            await self.show_privacy_inline(query)
-        elif data == "show_feedback":
-            await self.show_feedback_inline(query)
-        elif data == "submit_feedback":
-            await self.start_feedback_collection(query)
-        elif data == "show_admin":
-            await self.show_admin_inline(query)
-        elif data == "noop":
-            pass  # Do nothing for page indicator
-        elif data.startswith("page_"):
-            page_info = self.resolve_callback_data(data)
-            path, page_str = page_info.split(":", 1)
-            page = int(page_str)
-            await self.show_folder_contents(query, path, page)
-        elif data.startswith("folder_"):
-            path = self.resolve_callback_data(data)
-            await self.show_folder_contents(query, path)
-        elif data.startswith("file_"):
-            file_info = self.resolve_callback_data(data)
-            await self.handle_file_download(query, file_info)
-        elif data.startswith("download_"):
-            download_info = self.resolve_callback_data(data)
-            await self.download_and_send_file(query, download_info)
-        elif data.startswith("back_"):
-            path = self.resolve_callback_data(data)
-            await self.show_folder_contents(query, path)
-        elif data.startswith("admin_"):
-            await self.handle_admin_action(query, data[6:])
+        # "noop" (page indicator) matches neither table and is ignored
+        handler = self._callback_handlers.get(data)
+        if handler:
+            await handler(query)
+            return
+        
+        handler = self._callback_prefix_handlers.get(data.split("_", 1)[0])
+        if handler:
+            await handler(query, data)
+
+    async def _browse_root(self, query):
+        """Open the root folder"""
+        await self.show_folder_contents(query, "root")
+
+    async def _on_page_callback(self, query, data: str):
+        """Show another page of a folder (page_<path>:<page>)"""
+        path, page_str = self.resolve_callback_data(data).split(":", 1)
+        await self.show_folder_contents(query, path, int(page_str))
+
+    async def _on_folder_callback(self, query, data: str):
+        """Open a folder (folder_<path> or back_<path>)"""
+        await self.show_folder_contents(query, self.resolve_callback_data(data))
+
+    async def _on_file_callback(self, query, data: str):
+        """Show file details (file_<id>_<name>)"""
+        await self.handle_file_download(query, self.resolve_callback_data(data))
+
+    async def _on_download_callback(self, query, data: str):
+        """Send a file (download_<id>|<folder path>)"""
+        await self.download_and_send_file(query, self.resolve_callback_data(data))
+
+    async def _on_admin_callback(self, query, data: str):
+        """Route admin panel actions (admin_<action>)"""
+        await self.handle_admin_action(query, data[6:])
 
     async def show_folder_contents(self, query, path: str, page: int = 0):
         """Show folder contents with navigation buttons and pagination"""
-        contents = self.get_folder_contents(path)
+        is_admin = query.from_user.id == self.admin_id
+        key = (path, page, is_admin)
+        rendered = self._folder_page_cache.get(key)
+        if rendered is None:
+            rendered = self._render_folder_page(path, page, is_admin)
+            self._folder_page_cache[key] = rendered
+        text, reply_markup, hashed_callbacks = rendered
+        
+        # Re-register hashed callback data so a cached page's buttons still resolve
+        self._remember_callbacks(hashed_callbacks)
+        await self.safe_edit_message(query, text, reply_markup=reply_markup)
+
+    def _render_folder_page(self, path: str, page: int, is_admin: bool) -> Tuple[str, InlineKeyboardMarkup, List[Tuple[str, str]]]:
+        """Build (text, keyboard, hashed callback data) for one page of a folder"""
+        all_items, total_folders, total_files = self.get_folder_listing(path)
+        parent_path, folder_name, child_prefix = _split_path(path)
         
         keyboard = []
-        folders = []
-        files = []
+        hashed_callbacks = []
         
-        if contents:
-            folders = [item for item in contents if item['type'] == 'folder']
-            files = [item for item in contents if item['type'] == 'file']
+        def callback(prefix: str, data: str) -> str:
+            short_id, hashed = _encode_callback_data(prefix, data)
+            if hashed:
+                hashed_callbacks.append((short_id, data))
+            return short_id
         
         # Pagination settings
         items_per_page = 8
-        total_folders = len(folders)
-        total_files = len(files)
         total_items = total_folders + total_files
         
         # Calculate pagination for combined items
         start_idx = page * items_per_page
         end_idx = start_idx + items_per_page
         
-        # Combine folders and files for pagination
-        all_items = folders + files
         page_items = all_items[start_idx:end_idx]
         
         # Add items for current page
         for item in page_items:
             if item['type'] == 'folder':
-                folder_path = f"{path}/{item['name']}" if path != "root" else item['name']
-                callback_data = self.create_callback_data("folder", folder_path)
+                folder_path = child_prefix + item['name']
+                callback_data = callback("folder", folder_path)
                 keyboard.append([InlineKeyboardButton(
                     f"📁 {item['name']}", 
                     callback_data=callback_data
@@ -576,7 +1042,7 @@ class OneDriveBot:
                 size_mb = item.get('size', 0) / (1024 * 1024) if item.get('size', 0) > 0 else 0
                 file_id = item.get('id', item.get('path', item.get('name', f'file_{len(keyboard)}')))
                 file_info = f"{file_id}_{item.get('name', 'unknown')}"
-                callback_data = self.create_callback_data("file", file_info)
+                callback_data = callback("file", file_info)
                 keyboard.append([InlineKeyboardButton(
                     f"📄 {item['name']} ({size_mb:.1f}MB)", 
                     callback_data=callback_data
@@ -589,7 +1055,7 @@ class OneDriveBot:
             
             # Previous page button
             if page > 0:
-                prev_callback = self.create_callback_data("page", f"{path}:{page-1}")
+                prev_callback = callback("page", f"{path}:{page-1}")
                 pagination_row.append(InlineKeyboardButton("⬅️ Prev", callback_data=prev_callback))
             
             # Page indicator
@@ -597,7 +1063,7 @@ class OneDriveBot:
             
             # Next page button
             if page < total_pages - 1:
-                next_callback = self.create_callback_data("page", f"{path}:{page+1}")
+                next_callback = callback("page", f"{path}:{page+1}")
                 pagination_row.append(InlineKeyboardButton("Next ➡️", callback_data=next_callback))
             
             keyboard.append(pagination_row)
@@ -608,8 +1074,7 @@ class OneDriveBot:
         
         # Back button (left column) - always show back button
         if path != "root":
-            parent_path = "/".join(path.split("/")[:-1]) if "/" in path else "root"
-            back_callback = self.create_callback_data("back", parent_path)
+            back_callback = callback("back", parent_path)
             bottom_row.append(InlineKeyboardButton("⬅️ Back", callback_data=back_callback))
         else:
             bottom_row.append(InlineKeyboardButton("⬅️ Back", callback_data="main_menu"))
@@ -618,7 +1083,7 @@ class OneDriveBot:
         bottom_row.append(InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu"))
         
         # Refresh button (right column) - only for admin
-        if hasattr(query, 'from_user') and query.from_user.id == self.admin_id:
+        if is_admin:
             bottom_row.append(InlineKeyboardButton("🔄 Refresh", callback_data="refresh_index"))
         
         # Add the bottom row to keyboard
@@ -626,8 +1091,6 @@ class OneDriveBot:
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        folder_name = path.split("/")[-1] if path != "root" else "Sharing"
-        
         # Build status text
         if total_items == 0:
             status_text = "📁 Empty folder"
@@ -643,7 +1106,7 @@ class OneDriveBot:
         
         text = f"📁 Current folder: {folder_name}\n\n{status_text}"
         
-        await self.safe_edit_message(query, text, reply_markup=reply_markup)
+        return text, reply_markup, hashed_callbacks
 
     async def handle_file_download(self, query, file_info: str):
         """Handle file download confirmation"""
@@ -655,23 +1118,14 @@ class OneDriveBot:
         file_id, file_name = parts
         
         # Find file info to check size and get folder path
-        file_details = None
-        current_folder_path = "root"
-        
-        for path, items in self.indexer.file_index.items():
-            if isinstance(items, list):
-                for item in items:
-                    if item.get('id') == file_id:
-                        file_details = item
-                        current_folder_path = path
-                        break
-                if file_details:
-                    break
+        entry = self.indexer.find_item(file_id)
         
-        if not file_details:
+        if not entry:
             await self.safe_edit_message(query, "❌ Error: File not found in index.")
             return
         
+        current_folder_path, file_details = entry
+        
         # Check file size (Telegram limit is 50MB)
         file_size_mb = file_details.get('size', 0) / (1024 * 1024)
         if file_size_mb > 50:
@@ -709,23 +1163,15 @@ class OneDriveBot:
             file_id, current_folder_path = parts
             
             # Find file details from the index
-            file_details = None
-            file_name = "Unknown File"
-            
-            for path, items in self.indexer.file_index.items():
-                if isinstance(items, list):
-                    for item in items:
-                        if item.get('id') == file_id:
-                            file_details = item
-                            file_name = item.get('name', 'Unknown File')
-                            break
-                    if file_details:
-                        break
+            entry = self.indexer.find_item(file_id)
             
-            if not file_details:
+            if not entry:
                 await self.safe_edit_message(query, "❌ Error: File not found in index.")
                 return
             
+            file_details = entry[1]
+            file_name = file_details.get('name', 'Unknown File')
+            
             # Check file size (Telegram limit is 50MB)
             file_size = file_details.get('size', 0)
             file_size_mb = file_size / (1024 * 1024)
@@ -737,227 +1183,313 @@ class OneDriveBot:
                 await self.handle_large_file_download(query, file_details, file_name, current_folder_path, file_size_mb)
                 return
             
+            caption = f"📄 {file_name}\n📊 Size: {file_size_mb:.1f}MB"
+            cache_key = (file_id, file_details.get('modified', ''))
+            
+            # Files Telegram already has are re-sent by file_id, skipping the Graph download and upload
+            if await self._resend_cached_document(query, cache_key, caption):
+                reply_markup = self._back_to_folder_markup(current_folder_path)
+                await query.edit_message_text(f"✅ File sent successfully!\n\n{caption}", reply_markup=reply_markup)
+                return
+            
             # Send downloading message for small files
             await query.edit_message_text(f"⬇️ Downloading {file_name}...\n📊 Size: {file_size_mb:.1f}MB")
             
-            # Download the file asynchronously
-            file_content = await self.download_file_async(file_id)
+            # Serve from the local file cache, else download the file asynchronously
+            disk_key = _file_cache_key(*cache_key)
+            file_obj = await asyncio.to_thread(self._open_cached_file, disk_key)
+            from_disk = file_obj is not None
+            if not from_disk:
+                file_obj = await self.download_file_async(file_id, file_size)
             
-            if file_content:
-                # Send the file
-                from io import BytesIO
-                file_obj = BytesIO(file_content)
-                file_obj.name = file_name
-                
-                await query.message.reply_document(
-                    document=file_obj,
-                    filename=file_name,
-                    caption=f"📄 {file_name}\n📊 Size: {file_size_mb:.1f}MB"
-                )
-                
-                # Create navigation buttons
-                keyboard = [
-                    [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path))],
-                    [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"✅ File sent successfully!\n\n📄 {file_name}\n📊 Size: {file_size_mb:.1f}MB",
-                    reply_markup=reply_markup
-                )
+            if file_obj:
+                try:
+                    # Send the file
+                    sent = await query.message.reply_document(
+                        document=file_obj,
+                        filename=file_name,
+                        caption=caption
+                    )
+                    if sent.document:
+                        self._sent_file_ids[cache_key] = sent.document.file_id
+                    
+                    # Create navigation buttons
+                    reply_markup = self._back_to_folder_markup(current_folder_path)
+                    
+                    await query.edit_message_text(
+                        f"✅ File sent successfully!\n\n{caption}",
+                        reply_markup=reply_markup
+                    )
+                finally:
+                    if from_disk:
+                        file_obj.close()
+                    else:
+                        # Cache housekeeping runs after the user has their answer; the task closes file_obj
+                        self._schedule_cache_store(disk_key, file_obj)
                 
 
                     
             else:
                 # Download failed - provide OneDrive link as fallback
-                download_url = self.get_onedrive_download_url(file_id)
+                download_url = await self.get_onedrive_download_url(file_id)
+                reply_markup = self._large_file_keyboard(current_folder_path, download_url)
                 
                 if download_url:
-                    keyboard = [
-                        [InlineKeyboardButton("🔗 Download from OneDrive", url=download_url)],
-                        [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path))],
-                        [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await query.edit_message_text(
+                    text = (
                         f"❌ Download failed through Telegram\n\n"
                         f"📄 {file_name}\n"
                         f"📊 Size: {file_size_mb:.1f}MB\n\n"
-                        f"🔗 Use the OneDrive link below to download:",
-                        reply_markup=reply_markup
+                        f"🔗 Use the OneDrive link below to download:"
                     )
                 else:
-                    keyboard = [
-                        [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path))],
-                        [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await query.edit_message_text(
+                    text = (
                         f"❌ Download failed\n\n"
                         f"📄 {file_name}\n"
                         f"📊 Size: {file_size_mb:.1f}MB\n\n"
-                        f"Unable to download file or generate OneDrive link.",
-                        reply_markup=reply_markup
+                        f"Unable to download file or generate OneDrive link."
                     )
-                
-
+                await query.edit_message_text(text, reply_markup=reply_markup)
                     
         except Exception as e:
             logger.error(f"Error in download_and_send_file: {e}")
-            keyboard = [
-                [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path if 'current_folder_path' in locals() else "root"))],
-                [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self._back_to_folder_markup(current_folder_path if 'current_folder_path' in locals() else "root")
             await query.edit_message_text(
                 f"❌ An error occurred during download",
                 reply_markup=reply_markup
             )
 
+    @staticmethod
+    def _open_cached_file(disk_key: str) -> Optional[IO[bytes]]:
+        """Open a cached download and mark it recently used; None on a miss"""
+        path = os.path.join(FILE_CACHE_DIR, disk_key)
+        try:
+            file_obj = open(path, 'rb')
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return file_obj
+
+    def _schedule_cache_store(self, disk_key: str, file_obj: IO[bytes]):
+        """Copy a downloaded file into the disk cache in a tracked background task"""
+        task = asyncio.create_task(self._store_and_close(disk_key, file_obj))
+        self._cache_store_tasks.add(task)
+        task.add_done_callback(self._cache_store_tasks.discard)
+
+    async def _store_and_close(self, disk_key: str, file_obj: IO[bytes]):
+        """Store a download in the disk cache off the event loop, then close it"""
+        try:
+            await asyncio.to_thread(self._store_cached_file, disk_key, file_obj)
+        finally:
+            file_obj.close()
+
+    async def wait_for_cache_stores(self):
+        """Let in-flight disk-cache copies finish (their worker threads cannot be cancelled)"""
+        tasks = list(self._cache_store_tasks)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"Finished {len(tasks)} pending file cache writes")
+
+    @staticmethod
+    def _store_cached_file(disk_key: str, file_obj: IO[bytes]):
+        """Copy a downloaded file into the cache atomically, then evict the oldest entries over the cap"""
+        try:
+            os.makedirs(FILE_CACHE_DIR, exist_ok=True)
+            file_obj.seek(0)
+            fd, tmp_path = tempfile.mkstemp(dir=FILE_CACHE_DIR, prefix=f".{disk_key}.")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    while chunk := file_obj.read(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(tmp_path, os.path.join(FILE_CACHE_DIR, disk_key))
+            except OSError:
+                # Never leave a partial copy behind (e.g. ENOSPC mid-write)
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            
+            entries = []
+            total = 0
+            now = time.time()
+            with os.scandir(FILE_CACHE_DIR) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    if entry.name.startswith('.'):
+                        # Temp copy left by a crashed writer; in-flight ones are younger than this
+                        if now - stat.st_mtime > FILE_CACHE_STALE_TEMP_AGE:
+                            os.remove(entry.path)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            
+            if total > FILE_CACHE_MAX_BYTES:
+                for _, size, path in sorted(entries):
+                    os.remove(path)
+                    total -= size
+                    if total <= FILE_CACHE_MAX_BYTES:
+                        break
+        except OSError as e:
+            logger.warning(f"Could not cache downloaded file {disk_key}: {e}")
+
+    async def _resend_cached_document(self, query, cache_key: Tuple[str, str], caption: str) -> bool:
+        """Re-send a previously uploaded document by its Telegram file_id; False if not cached or rejected"""
+        tg_file_id = self._sent_file_ids.get(cache_key)
+        if not tg_file_id:
+            return False
+        try:
+            await query.message.reply_document(document=tg_file_id, caption=caption)
+            return True
+        except Exception as e:
+            logger.warning(f"Cached Telegram file_id rejected for {cache_key[0]}, re-uploading: {e}")
+            self._sent_file_ids.pop(cache_key, None)
+            return False
+
     async def handle_large_file_download(self, query, file_details, file_name, current_folder_path, file_size_mb):
         """Handle large file download by providing OneDrive direct link"""
         try:
             # Get OneDrive download URL
-            download_url = self.get_onedrive_download_url(file_details['id'])
+            download_url = await self.get_onedrive_download_url(file_details['id'])
+            reply_markup = self._large_file_keyboard(current_folder_path, download_url)
             
             if download_url:
-                keyboard = [
-                    [InlineKeyboardButton("🔗 Download from OneDrive", url=download_url)],
-                    [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path))],
-                    [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"📄 **{file_name}**\n"
+                text = (
+                    f"📄 {file_name}\n"
                     f"📊 Size: {file_size_mb:.1f}MB\n\n"
                     f"⚠️ This file exceeds Telegram's 50MB limit.\n"
                     f"🔗 Use the link below to download directly from OneDrive:\n\n"
-                    f"💡 The download will start automatically when you click the link.",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    f"💡 The download will start automatically when you click the link."
                 )
-                
-
-                    
             else:
                 # Fallback if download URL cannot be generated
-                keyboard = [
-                    [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path))],
-                    [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
+                text = (
                     f"❌ File too large for Telegram\n\n"
                     f"📄 {file_name}\n"
                     f"📊 Size: {file_size_mb:.1f}MB\n\n"
-                    f"⚠️ Telegram has a 50MB limit and download link is unavailable.",
-                    reply_markup=reply_markup
+                    f"⚠️ Telegram has a 50MB limit and download link is unavailable."
                 )
+            await query.edit_message_text(text, reply_markup=reply_markup)
                 
         except Exception as e:
             logger.error(f"Error handling large file download: {e}")
-            keyboard = [
-                [InlineKeyboardButton("⬅️ Back to Folder", callback_data=self.create_callback_data("folder", current_folder_path))],
-                [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self._back_to_folder_markup(current_folder_path)
             await query.edit_message_text(
                 f"❌ Error handling large file\n\n📄 {file_name}",
                 reply_markup=reply_markup
             )
 
-    def get_onedrive_download_url(self, file_id: str) -> Optional[str]:
+    async def get_onedrive_download_url(self, file_id: str) -> Optional[str]:
         """Get OneDrive direct download URL for a file"""
+        # Links captured while indexing are valid for a while, so fresh indexes need no Graph call
+        cached = (
+            self._dl_url_cache.get(file_id)
+            or self.indexer.get_cached_download_url(file_id)
+            or self._share_link_cache.get(file_id)
+        )
+        if cached:
+            return cached
+        
         try:
-            token = self.indexer.get_access_token()
+            token = await self.indexer.get_access_token_async()
             if not token:
                 return None
                 
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"https://graph.microsoft.com/v1.0/users/{self.indexer.target_user_id}/drive/items/{file_id}"
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                file_data = response.json()
-                # Get the @microsoft.graph.downloadUrl which provides direct download
-                download_url = file_data.get('@microsoft.graph.downloadUrl')
-                if download_url:
-                    return download_url
-                    
-                # Alternative: get sharing link
-                share_url = f"https://graph.microsoft.com/v1.0/users/{self.indexer.target_user_id}/drive/items/{file_id}/createLink"
-                share_payload = {
-                    "type": "view",
-                    "scope": "anonymous"
-                }
-                share_response = requests.post(share_url, headers=headers, json=share_payload)
-                if share_response.status_code == 201:
-                    share_data = share_response.json()
-                    return share_data.get('link', {}).get('webUrl')
+            headers = self._graph_headers(token)
+            url = self._graph_items_url + file_id
+            session = await self.get_http_session()
+            timeout = aiohttp.ClientTimeout(total=30)
+            
+            async with session.get(url, headers=headers, timeout=timeout) as response:
+                if response.status != 200:
+                    return None
+                file_data = await response.json()
+            
+            # Get the @microsoft.graph.downloadUrl which provides direct download
+            download_url = file_data.get('@microsoft.graph.downloadUrl')
+            if download_url:
+                self._dl_url_cache[file_id] = download_url
+                return download_url
+                
+            # Alternative: get sharing link
+            share_url = f"{self._graph_items_url}{file_id}/createLink"
+            share_payload = {
+                "type": "view",
+                "scope": "anonymous"
+            }
+            async with session.post(share_url, headers=headers, json=share_payload, timeout=timeout) as share_response:
+                if share_response.status == 201:
+                    share_data = await share_response.json()
+                    share_link = share_data.get('link', {}).get('webUrl')
+                    if share_link:
+                        self._share_link_cache[file_id] = share_link
+                    return share_link
                     
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout getting OneDrive download URL for {file_id}")
         except Exception as e:
             logger.error(f"Error getting OneDrive download URL: {e}")
             
         return None
 
-    async def refresh_index(self, query):
-        """Refresh file index (admin only) with async progress updates"""
-        if query.from_user.id != self.admin_id:
-            await query.answer("❌ Access denied. Admin only.", show_alert=True)
-            return
-            
-        # Check if indexing is already in progress
-        if hasattr(self.indexer, 'is_indexing') and self.indexer.is_indexing:
-            await query.answer("⏳ Indexing already in progress. Please wait...", show_alert=True)
-            return
-            
-        initial_message = await query.edit_message_text("🔄 Starting file index refresh...\n\n📊 Progress: 0%\n📁 Initializing...")
-        
-        # Keep track of message for updates
-        chat_id = query.message.chat_id
-        message_id = initial_message.message_id
-        
-        # Progress callback to update the message
-        last_update_time = datetime.now()
+    def _invalidate_index_caches(self):
+        """Drop caches derived from the previous file index"""
+        self._dl_url_cache.clear()
+        self._share_link_cache.clear()
+        self._folder_cache.clear()
+        self._folder_page_cache.clear()
+
+    async def _rebuild_index_with_progress(self, chat_id: int, message_id: int, title: str) -> bool:
+        """Force an index rebuild while a single background task reports progress in the given message"""
+        # The indexer only records the latest progress; the pump decides when to edit the message
+        state = {'progress': (0, 0, "")}
         
         async def progress_callback(current, total, current_path):
-            nonlocal last_update_time
-            
-            # Throttle updates to avoid hitting rate limits (update every 2 seconds max)
-            now = datetime.now()
-            if (now - last_update_time).total_seconds() < 2:
-                return
-                
-            last_update_time = now
-            
+            state['progress'] = (current, total, current_path)
+        
+        pump = asyncio.create_task(self._progress_pump(chat_id, message_id, title, state))
+        # One periodic keep-alive for the whole rebuild, instead of a ping task per progress tick
+        keepalive = await self.start_keepalive_during_operation("index rebuild")
+        try:
+            return await self.indexer.build_index_async(force_rebuild=True, progress_callback=progress_callback)
+        finally:
+            tasks = [task for task in (pump, keepalive) if task]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _progress_pump(self, chat_id: int, message_id: int, title: str, state: Dict[str, Tuple[int, int, str]]):
+        """Edit the progress message at most once per PROGRESS_UPDATE_INTERVAL until cancelled"""
+        last_text = None
+        while True:
+            await asyncio.sleep(PROGRESS_UPDATE_INTERVAL)
+            current, total, current_path = state['progress']
             try:
                 if total > 0:
                     progress_pct = min(100, int((current / total) * 100))
                 else:
                     progress_pct = 0
                 
-                # Create progress bar
-                filled = int(progress_pct / 10)
-                bar = "█" * filled + "░" * (10 - filled)
+                bar = _PROGRESS_BARS[progress_pct // 10]
                 
                 # Truncate path if too long
                 display_path = current_path if len(current_path) <= 30 else f"...{current_path[-27:]}"
                 
                 progress_text = (
-                    f"🔄 Refreshing file index...\n\n"
+                    f"{title}\n\n"
                     f"📊 Progress: {progress_pct}% {bar}\n"
                     f"📁 Current: {display_path}\n"
                     f"📈 Processed: {current}/{total} folders"
                 )
                 
-                # Also send keep-alive ping to prevent Render shutdown
-                if hasattr(self, 'send_keepalive_ping'):
-                    asyncio.create_task(self.send_keepalive_ping())
+                # Telegram rejects identical edits ("message is not modified") but still counts them
+                if progress_text == last_text:
+                    continue
+                last_text = progress_text
                 
                 await self.application.bot.edit_message_text(
                     chat_id=chat_id,
@@ -966,12 +1498,30 @@ class OneDriveBot:
                 )
             except Exception as e:
                 logger.warning(f"Error updating progress message: {e}")
+
+    async def refresh_index(self, query):
+        """Refresh file index (admin only) with async progress updates"""
+        if query.from_user.id != self.admin_id:
+            await query.answer("❌ Access denied. Admin only.", show_alert=True)
+            return
+            
+        # Check if indexing is already in progress
+        if hasattr(self.indexer, 'is_indexing') and self.indexer.is_indexing:
+            await query.answer("⏳ Indexing already in progress. Please wait...", show_alert=True)
+            return
+            
+        initial_message = await query.edit_message_text("🔄 Starting file index refresh...\n\n📊 Progress: 0%\n📁 Initializing...")
+        
+        # Keep track of message for updates
+        chat_id = query.message.chat_id
+        message_id = initial_message.message_id
         
         try:
             # Start async indexing with progress updates
-            success = await self.indexer.build_index_async(force_rebuild=True, progress_callback=progress_callback)
+            success = await self._rebuild_index_with_progress(chat_id, message_id, "🔄 Refreshing file index...")
             
             if success:
+                self._invalidate_index_caches()
                 stats = self.indexer.get_stats()
                 final_text = (
                     "✅ File index refreshed successfully!\n\n"
@@ -1023,60 +1573,14 @@ class OneDriveBot:
             chat_id = query.message.chat_id
             message_id = initial_message.message_id
             
-            # Progress callback to update the message
-            last_update_time = datetime.now()
-            
-            async def progress_callback(current, total, current_path):
-                nonlocal last_update_time
-                
-                # Throttle updates to avoid hitting rate limits
-                now = datetime.now()
-                if (now - last_update_time).total_seconds() < 2:
-                    return
-                    
-                last_update_time = now
-                
-                try:
-                    if total > 0:
-                        progress_pct = min(100, int((current / total) * 100))
-                    else:
-                        progress_pct = 0
-                    
-                    # Create progress bar
-                    filled = int(progress_pct / 10)
-                    bar = "█" * filled + "░" * (10 - filled)
-                    
-                    # Truncate path if too long
-                    display_path = current_path if len(current_path) <= 30 else f"...{current_path[-27:]}"
-                    
-                    progress_text = (
-                        f"🔄 Rebuilding file index...\n\n"
-                        f"📊 Progress: {progress_pct}% {bar}\n"
-                        f"📁 Current: {display_path}\n"
-                        f"📈 Processed: {current}/{total} folders"
-                    )
-                    
-                    # Send keep-alive ping to prevent Render shutdown
-                    if hasattr(self, 'send_keepalive_ping'):
-                        asyncio.create_task(self.send_keepalive_ping())
-                    
-                    await self.application.bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        text=progress_text
-                    )
-                except Exception as e:
-                    logger.warning(f"Error updating rebuild progress message: {e}")
-            
             try:
                 # Start async indexing with progress updates
-                success = await self.indexer.build_index_async(force_rebuild=True, progress_callback=progress_callback)
+                success = await self._rebuild_index_with_progress(chat_id, message_id, "🔄 Rebuilding file index...")
                 
-                keyboard = [[InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-                           [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = BACK_TO_ADMIN_MARKUP
                 
                 if success:
+                    self._invalidate_index_caches()
                     stats = self.indexer.get_stats()
                     final_text = (
                         "✅ File index rebuilt successfully!\n\n"
@@ -1101,9 +1605,7 @@ class OneDriveBot:
                     )
             except Exception as e:
                 logger.error(f"Error during async index rebuild: {e}")
-                keyboard = [[InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-                           [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = BACK_TO_ADMIN_MARKUP
                 try:
                     await self.application.bot.edit_message_text(
                         chat_id=chat_id,
@@ -1118,33 +1620,13 @@ class OneDriveBot:
             # Enhanced user management with view and add options
             await self.show_user_management(query)
             
-        elif action == "view_users":
-            user_count = len(self.unlimited_users)
-            if user_count == 0:
-                user_list_text = "👥 No users registered yet."
-            else:
-                # Get user details from database if available
-                users_info = []
-                if db_manager.enabled:
-                    all_users = db_manager.get_all_users_data()
-                    for user_data in all_users:
-                        users_info.append(f"• {user_data.get('first_name', 'Unknown')} (@{user_data.get('username', 'none')}) - ID: {user_data.get('user_id')}")
-                else:
-                    # Fallback to just showing user IDs
-                    for user_id in self.unlimited_users:
-                        users_info.append(f"• User ID: {user_id}")
-                
-                user_list_text = f"👥 Total users: {user_count}\n\n" + "\n".join(users_info[:20])
-                if len(users_info) > 20:
-                    user_list_text += f"\n\n... and {len(users_info) - 20} more users"
-            
-            keyboard = [
-                [InlineKeyboardButton("👥 User Management", callback_data="admin_users")],
-                [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-                [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await self.safe_edit_message(query, user_list_text, reply_markup=reply_markup)
+        elif action == "view_users" or action.startswith("view_users:"):
+            # admin_view_users:<offset> pages through the list; malformed data falls back to page 0
+            try:
+                offset = int(action.partition(":")[2] or 0)
+            except ValueError:
+                offset = 0
+            await self.show_users_page(query, offset)
             
         elif action == "add_user":
             await self.start_add_user_collection(query)
@@ -1178,9 +1660,7 @@ class OneDriveBot:
             except Exception as e:
                 stats_text = f"📊 Bot Statistics\n\n❌ Error loading stats: {e}"
             
-            keyboard = [[InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-                       [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = BACK_TO_ADMIN_MARKUP
             await self.safe_edit_message(query, stats_text, reply_markup=reply_markup)
             
         elif action == "shutdown":
@@ -1189,38 +1669,21 @@ class OneDriveBot:
             # Stop the application - this will trigger the shutdown process
             await self.application.stop()
             await self.application.shutdown()
-            import os
+            # os._exit skips atexit, so flush queued log records first
+            stop_queue_logging()
             os._exit(0)  # Force exit since we're in a callback
 
     async def show_main_menu(self, query):
         """Show the main menu"""
-        keyboard = [
-            [InlineKeyboardButton("📁 Browse Files", callback_data="browse_root")]
-        ]
-        
-        # Add refresh index button only for admin
-        if query.from_user.id == self.admin_id:
-            keyboard.append([InlineKeyboardButton("🔄 Refresh Index", callback_data="refresh_index")])
-            
-        # Add information and admin buttons
-        keyboard.extend([
-            [InlineKeyboardButton("❓ Help", callback_data="show_help"),
-             InlineKeyboardButton("ℹ️ About", callback_data="show_about")],
-            [InlineKeyboardButton("🔒 Privacy", callback_data="show_privacy"),
-             InlineKeyboardButton("📝 Feedback", callback_data="show_feedback")]
-        ])
-        
-        if query.from_user.id == self.admin_id:
-            keyboard.append([InlineKeyboardButton("⚙️ Admin Panel", callback_data="show_admin")])
-            
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        is_admin = query.from_user.id == self.admin_id
+        reply_markup = MAIN_MENU_MARKUPS[is_admin]
         
         welcome_text = (
             "🎓 OneDrive Sharing Bot\n\n"
             "📂 Browse and download sharing files\n"
         )
         
-        if query.from_user.id == self.admin_id:
+        if is_admin:
             welcome_text += "⚙️ Admin controls available\n"
             
         welcome_text += "\nSelect an option below:"
@@ -1229,26 +1692,7 @@ class OneDriveBot:
 
     async def menu_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /menu command - show bot menu"""
-        keyboard = [
-            [InlineKeyboardButton("📁 Browse Files", callback_data="browse_root")]
-        ]
-        
-        # Add refresh index button only for admin
-        if update.effective_user.id == self.admin_id:
-            keyboard.append([InlineKeyboardButton("🔄 Refresh Index", callback_data="refresh_index")])
-            
-        # Add additional menu options
-        keyboard.extend([
-            [InlineKeyboardButton("❓ Help", callback_data="show_help"),
-             InlineKeyboardButton("ℹ️ About", callback_data="show_about")],
-            [InlineKeyboardButton("🔒 Privacy", callback_data="show_privacy"),
-             InlineKeyboardButton("📝 Feedback", callback_data="show_feedback")]
-        ])
-        
-        if update.effective_user.id == self.admin_id:
-            keyboard.append([InlineKeyboardButton("⚙️ Admin Panel", callback_data="show_admin")])
-            
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = MAIN_MENU_MARKUPS[update.effective_user.id == self.admin_id]
         
         menu_text = (
             "📋 OneDrive Sharing Bot Menu\n\n"
@@ -1277,8 +1721,7 @@ class OneDriveBot:
             "⚡ Performance: Files are cached for speed"
         )
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_MENU_MARKUP
         await self.safe_edit_message(query, help_text, reply_markup=reply_markup)
 
     async def show_about_inline(self, query):
@@ -1297,8 +1740,7 @@ class OneDriveBot:
             "🔗 Powered by Microsoft Graph API & Phi AI"
         )
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_MENU_MARKUP
         await self.safe_edit_message(query, about_text, reply_markup=reply_markup)
 
     async def show_privacy_inline(self, query):
@@ -1319,8 +1761,7 @@ class OneDriveBot:
             "• Data deletion available on request"
         )
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_MENU_MARKUP
         await self.safe_edit_message(query, privacy_text, reply_markup=reply_markup)
 
     async def safe_edit_message(self, query, text: str, reply_markup=None, parse_mode=None):
@@ -1363,16 +1804,7 @@ class OneDriveBot:
             await query.answer("❌ Access denied.", show_alert=True)
             return
             
-        keyboard = [
-            [InlineKeyboardButton("🔄 Rebuild Index", callback_data="admin_rebuild")],
-            [InlineKeyboardButton("👥 Manage Users", callback_data="admin_users")],
-            [InlineKeyboardButton("📢 Send Mass Message", callback_data="admin_mass_message")],
-            [InlineKeyboardButton("📝 View Feedback", callback_data="admin_feedback")],
-            [InlineKeyboardButton("📊 Bot Stats", callback_data="admin_stats")],
-            [InlineKeyboardButton("🛑 Shutdown Bot", callback_data="admin_shutdown")],
-            [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = ADMIN_PANEL_MARKUP
         
         await self.safe_edit_message(
             query,
@@ -1391,17 +1823,13 @@ class OneDriveBot:
             "Click the button below to submit your feedback."
         )
         
-        keyboard = [
-            [InlineKeyboardButton("📝 Submit Feedback", callback_data="submit_feedback")],
-            [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = FEEDBACK_MARKUP
         await self.safe_edit_message(query, feedback_text, reply_markup=reply_markup)
 
     async def start_feedback_collection(self, query):
         """Start feedback collection process"""
         user_id = query.from_user.id
-        self.awaiting_feedback.add(user_id)
+        self.awaiting_feedback[user_id] = True
         
         feedback_text = (
             "📝 Submit Your Feedback\n\n"
@@ -1410,10 +1838,7 @@ class OneDriveBot:
             "⚠️ Note: Your next message will be recorded as feedback."
         )
         
-        keyboard = [
-            [InlineKeyboardButton("❌ Cancel", callback_data="show_feedback")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = CANCEL_MARKUPS["show_feedback"]
         await query.edit_message_text(feedback_text, reply_markup=reply_markup)
 
     async def start_mass_message_collection(self, query):
@@ -1423,7 +1848,7 @@ class OneDriveBot:
             await query.answer("❌ Access denied.", show_alert=True)
             return
             
-        self.awaiting_mass_message.add(user_id)
+        self.awaiting_mass_message[user_id] = True
         
         mass_message_text = (
             "📢 Send Mass Message\n\n"
@@ -1432,42 +1857,31 @@ class OneDriveBot:
             "⚠️ Note: Your next message will be sent to all users."
         )
         
-        keyboard = [
-            [InlineKeyboardButton("❌ Cancel", callback_data="show_admin")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = CANCEL_MARKUPS["show_admin"]
         await query.edit_message_text(mass_message_text, reply_markup=reply_markup)
 
     async def send_mass_message(self, message_text: str, admin_id: int):
         """Send mass message to all users"""
-        total_users = len(self.unlimited_users)
-        success_count = 0
-        failed_count = 0
+        user_ids = list(self.unlimited_users)  # Snapshot; inactive users are removed afterwards
+        total_users = len(user_ids)
+        text = f"📢 Message from Admin:\n\n{message_text}"
         
         logger.info(f"Starting mass message send to {total_users} users")
         
-        for user_id in self.unlimited_users.copy():  # Use copy to avoid modification during iteration
-            try:
-                await self.application.bot.send_message(
-                    chat_id=user_id, 
-                    text=f"📢 Message from Admin:\n\n{message_text}"
-                )
-                success_count += 1
-                logger.debug(f"Mass message sent successfully to user {user_id}")
-            except Exception as e:
+        results = await asyncio.gather(*(self._broadcast_send(uid, text) for uid in user_ids), return_exceptions=True)
+        
+        blocked = []
+        failed_count = 0
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
                 failed_count += 1
-                logger.warning(f"Failed to send mass message to user {user_id}: {e}")
-                
+                logger.warning(f"Failed to send mass message to user {user_id}: {result}")
                 # Remove user if they blocked the bot or account was deleted
-                if "bot was blocked" in str(e).lower() or "user is deactivated" in str(e).lower():
-                    logger.info(f"Removing inactive user {user_id} from user list")
-                    self.unlimited_users.discard(user_id)
-                    
-                    # Remove from database if available
-                    if db_manager.enabled:
-                        db_manager.remove_user(user_id)
-                    else:
-                        self.save_data()  # Fallback to file
+                if _is_inactive_user_error(result):
+                    blocked.append(user_id)
+        success_count = total_users - failed_count
+        
+        await self._remove_users(blocked)
         
         # Send summary to admin
         summary_text = (
@@ -1478,11 +1892,7 @@ class OneDriveBot:
             f"💬 Message sent:\n{message_text}"
         )
         
-        keyboard = [
-            [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = BACK_TO_ADMIN_MARKUP
         
         try:
             await self.application.bot.send_message(
@@ -1493,6 +1903,58 @@ class OneDriveBot:
         except Exception as e:
             logger.error(f"Failed to send mass message summary to admin: {e}")
 
+    async def show_users_page(self, query, offset: int = 0):
+        """Show one page of registered users with Prev/Next buttons"""
+        if db_manager.enabled:
+            user_count = await asyncio.to_thread(db_manager.get_user_count)
+        else:
+            user_count = len(self.unlimited_users)
+        keyboard = []
+        if user_count == 0:
+            user_list_text = "👥 No users registered yet."
+        else:
+            # Stale or out-of-range offsets land on the first/last page instead of an empty one
+            last_page_offset = (user_count - 1) // USERS_PAGE_SIZE * USERS_PAGE_SIZE
+            offset = min(max(0, offset), last_page_offset)
+            
+            # Only the requested page is fetched from the database
+            if db_manager.enabled:
+                page_users = await asyncio.to_thread(db_manager.get_users_page, offset, USERS_PAGE_SIZE)
+                users_info = [
+                    f"• {user_data.get('first_name', 'Unknown')} (@{user_data.get('username', 'none')}) - ID: {user_data.get('user_id')}"
+                    for user_data in page_users
+                ]
+            else:
+                # Fallback to just showing user IDs
+                page_ids = sorted(self.unlimited_users)[offset:offset + USERS_PAGE_SIZE]
+                users_info = [f"• User ID: {user_id}" for user_id in page_ids]
+            
+            shown_end = min(offset + USERS_PAGE_SIZE, user_count)
+            user_list_text = (
+                f"👥 Total users: {user_count}\n"
+                f"Showing {offset + 1}-{shown_end}\n\n" + "\n".join(users_info)
+            )
+            
+            pagination_row = []
+            if offset > 0:
+                pagination_row.append(InlineKeyboardButton(
+                    "⬅️ Prev", callback_data=f"admin_view_users:{max(0, offset - USERS_PAGE_SIZE)}"
+                ))
+            if shown_end < user_count:
+                pagination_row.append(InlineKeyboardButton(
+                    "Next ➡️", callback_data=f"admin_view_users:{offset + USERS_PAGE_SIZE}"
+                ))
+            if pagination_row:
+                keyboard.append(pagination_row)
+        
+        keyboard.extend([
+            [InlineKeyboardButton("👥 User Management", callback_data="admin_users")],
+            [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
+            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
+        ])
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await self.safe_edit_message(query, user_list_text, reply_markup=reply_markup)
+
     async def show_user_management(self, query):
         """Show user management options"""
         if query.from_user.id != self.admin_id:
@@ -1506,13 +1968,7 @@ class OneDriveBot:
             "Choose an action:"
         )
         
-        keyboard = [
-            [InlineKeyboardButton("👀 View All Users", callback_data="admin_view_users")],
-            [InlineKeyboardButton("➕ Add User Manually", callback_data="admin_add_user")],
-            [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = USER_MANAGEMENT_MARKUP
         await query.edit_message_text(management_text, reply_markup=reply_markup)
 
     async def start_add_user_collection(self, query):
@@ -1522,7 +1978,7 @@ class OneDriveBot:
             return
             
         user_id = query.from_user.id
-        self.awaiting_add_user.add(user_id)
+        self.awaiting_add_user[user_id] = True
         
         add_user_text = (
             "➕ Add User Manually\n\n"
@@ -1534,10 +1990,7 @@ class OneDriveBot:
             "Send the numeric User ID now:"
         )
         
-        keyboard = [
-            [InlineKeyboardButton("❌ Cancel", callback_data="admin_users")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = CANCEL_MARKUPS["admin_users"]
         await query.edit_message_text(add_user_text, reply_markup=reply_markup)
 
     async def add_user_manually(self, user_id_to_add: int, admin_id: int):
@@ -1558,7 +2011,8 @@ class OneDriveBot:
                 
                 # Add to database if available
                 if db_manager.enabled:
-                    if db_manager.add_user(
+                    if await asyncio.to_thread(
+                        db_manager.add_user,
                         user_id=user_id_to_add,
                         username=username,
                         first_name=first_name,
@@ -1569,7 +2023,7 @@ class OneDriveBot:
                         logger.warning(f"Failed to add user {user_id_to_add} to database")
                 else:
                     # Save to file as fallback
-                    self.save_unlimited_users()
+                    await self.save_unlimited_users()
                 
                 # Try to send welcome message to the new user
                 try:
@@ -1598,7 +2052,8 @@ class OneDriveBot:
             except Exception as e:
                 # User info not accessible, but still add them
                 if db_manager.enabled:
-                    if db_manager.add_user(
+                    if await asyncio.to_thread(
+                        db_manager.add_user,
                         user_id=user_id_to_add,
                         username=None,
                         first_name="Unknown",
@@ -1607,7 +2062,7 @@ class OneDriveBot:
                         logger.info(f"User {user_id_to_add} manually added to database (minimal info) by admin {admin_id}")
                 else:
                     # Save to file as fallback
-                    self.save_unlimited_users()
+                    await self.save_unlimited_users()
                 
                 success_msg = (
                     f"✅ User added with ID: {user_id_to_add}\n\n"
@@ -1629,7 +2084,7 @@ class OneDriveBot:
         # Check if this is a mass message from admin
         if user_id in self.awaiting_mass_message:
             # Remove admin from waiting list
-            self.awaiting_mass_message.discard(user_id)
+            self.awaiting_mass_message.pop(user_id, None)
             
             # Get the message text
             message_text = update.message.text
@@ -1647,7 +2102,7 @@ class OneDriveBot:
         # Check if admin is adding a user manually
         if user_id in self.awaiting_add_user:
             # Remove admin from waiting list
-            self.awaiting_add_user.discard(user_id)
+            self.awaiting_add_user.pop(user_id, None)
             
             # Get the user ID text
             user_id_text = update.message.text.strip()
@@ -1660,11 +2115,7 @@ class OneDriveBot:
                 result_message = await self.add_user_manually(user_id_to_add, user_id)
                 
                 # Send result with back button
-                keyboard = [
-                    [InlineKeyboardButton("👥 User Management", callback_data="admin_users")],
-                    [InlineKeyboardButton("🔙 Admin Panel", callback_data="show_admin")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = USER_ADDED_MARKUP
                 
                 await update.message.reply_text(
                     result_message,
@@ -1673,11 +2124,7 @@ class OneDriveBot:
                 
             except ValueError:
                 # Invalid user ID format
-                keyboard = [
-                    [InlineKeyboardButton("🔄 Try Again", callback_data="admin_add_user")],
-                    [InlineKeyboardButton("👥 User Management", callback_data="admin_users")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = ADD_USER_RETRY_MARKUP
                 
                 await update.message.reply_text(
                     f"❌ Invalid User ID format: '{user_id_text}'\n\n"
@@ -1692,7 +2139,7 @@ class OneDriveBot:
             return  # Not waiting for feedback from this user
         
         # Remove user from waiting list
-        self.awaiting_feedback.discard(user_id)
+        self.awaiting_feedback.pop(user_id, None)
         
         # Get feedback text
         feedback_text = update.message.text
@@ -1703,7 +2150,7 @@ class OneDriveBot:
         try:
             if db_manager.enabled:
                 # Save to database
-                if db_manager.add_feedback(user_id, feedback_text):
+                if await asyncio.to_thread(db_manager.add_feedback, user_id, feedback_text):
                     logger.info(f"Feedback saved to database from user {user_id}: {feedback_text[:100]}...")
                 else:
                     logger.error("Failed to save feedback to database")
@@ -1723,10 +2170,7 @@ class OneDriveBot:
                 logger.info(f"Feedback saved to file from user {user_id}: {feedback_text[:100]}...")
             
             # Send confirmation to user
-            keyboard = [
-                [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = BACK_TO_MENU_MARKUP
             
             await update.message.reply_text(
                 "✅ Thank you for your feedback!\n\n"
@@ -1752,10 +2196,7 @@ class OneDriveBot:
             logger.error(f"Error saving feedback: {e}")
             
             # Send error message to user
-            keyboard = [
-                [InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = BACK_TO_MENU_MARKUP
             
             await update.message.reply_text(
                 "❌ Error saving your feedback. Please try again later.\n"
@@ -1770,11 +2211,11 @@ class OneDriveBot:
             return
             
         try:
-            feedback_text = "📝 Recent Feedback\n\n"
+            parts = ["📝 Recent Feedback\n\n"]
             
             if db_manager.enabled:
                 # Get feedback from database
-                feedback_list = db_manager.get_recent_feedback(limit=10)
+                feedback_list = await asyncio.to_thread(db_manager.get_recent_feedback, limit=10)
                 if feedback_list:
                     for i, feedback in enumerate(feedback_list, 1):
                         user_id = feedback.get('user_id', 'Unknown')
@@ -1785,42 +2226,36 @@ class OneDriveBot:
                         if len(message) > 100:
                             message = message[:100] + "..."
                         
-                        feedback_text += f"{i}. ID: {user_id}\n📅 {timestamp}\n💬 {message}\n\n"
+                        parts.append(f"{i}. ID: {user_id}\n📅 {timestamp}\n💬 {message}\n\n")
                 else:
-                    feedback_text += "No feedback found in database."
+                    parts.append("No feedback found in database.")
             else:
                 # Fallback to reading from file
-                import os
                 if os.path.exists('feedback_log.txt'):
                     with open('feedback_log.txt', 'r', encoding='utf-8') as f:
                         content = f.read()
                         if content.strip():
                             # Get last 1000 characters to show recent feedback
                             recent_content = content[-1000:] if len(content) > 1000 else content
-                            feedback_text += f"Recent entries:\n\n{recent_content}"
+                            parts.append(f"Recent entries:\n\n{recent_content}")
                         else:
-                            feedback_text += "No feedback found in file."
+                            parts.append("No feedback found in file.")
                 else:
-                    feedback_text += "No feedback file found."
+                    parts.append("No feedback file found.")
+            
+            feedback_text = "".join(parts)
             
             # Limit message length for Telegram
             if len(feedback_text) > 4000:
                 feedback_text = feedback_text[:4000] + "\n\n... (truncated)"
             
-            keyboard = [
-                [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")],
-                [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = BACK_TO_ADMIN_MARKUP
             
             await self.safe_edit_message(query, feedback_text, reply_markup=reply_markup)
             
         except Exception as e:
             logger.error(f"Error showing admin feedback: {e}")
-            keyboard = [
-                [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="show_admin")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = BACK_TO_ADMIN_MARKUP
             await query.edit_message_text(
                 "❌ Error loading feedback. Please try again later.",
                 reply_markup=reply_markup
@@ -1828,8 +2263,27 @@ class OneDriveBot:
 
     # ...existing code...
 
+    def _register_handlers(self):
+        """Register all update handlers on the application in one batch"""
+        self.application.add_handlers([
+            CommandHandler(list(self._command_map), self._dispatch_command),
+            CallbackQueryHandler(self.button_callback),
+            MessageHandler(_TEXT_NOT_COMMAND, self.handle_feedback_message)
+        ])
+
+    async def _dispatch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Route a bot command to its handler through the command map"""
+        # "/Start@SomeBot args" -> "start"; PTB matches commands case-insensitively
+        command = update.effective_message.text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+        handler = self._command_map.get(command)
+        if handler:
+            await handler(update, context)
+
     def run(self):
         """Run the bot"""
+        # Use uvloop for the polling event loop when it is installed
+        install_uvloop()
+        
         # Initialize file index (load cached or build if necessary)
         logger.info("Initializing file index...")
         try:
@@ -1847,15 +2301,7 @@ class OneDriveBot:
         self.application = Application.builder().token(self.token).build()
         
         # Add handlers
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("menu", self.menu_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("about", self.about_command))
-        self.application.add_handler(CommandHandler("privacy", self.privacy_command))
-        self.application.add_handler(CommandHandler("feedback", self.feedback_command))
-        self.application.add_handler(CommandHandler("admin", self.admin_command))
-        self.application.add_handler(CallbackQueryHandler(self.button_callback))
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_feedback_message))
+        self._register_handlers()
         
         # Start polling
         logger.info("Starting bot...")
@@ -1863,23 +2309,43 @@ class OneDriveBot:
         # Run bot with proper python-telegram-bot 20.x API
         try:
             # Set startup time for pending message detection
-            from datetime import datetime, timezone
             self.startup_time = datetime.now(timezone.utc)
             
-            # Send startup notification on first run
-            async def post_init(application):
-                """Post initialization hook to send startup notification"""
+            async def send_startup_notification():
+                """Notify subscribers that the bot is up"""
                 try:
                     await self.notify_subscribers("🟢 Bot Started Operations")
                 except Exception as e:
                     logger.error(f"Error sending startup notification: {e}")
             
-            # Add post init hook
+            # Send startup notification on first run, in the background so polling starts immediately
+            async def post_init(application):
+                """Post initialization hook to send startup notification"""
+                self._startup_notify_task = asyncio.create_task(send_startup_notification())
+            
+            async def post_shutdown(application):
+                """Post shutdown hook to release shared resources"""
+                if self._startup_notify_task and not self._startup_notify_task.done():
+                    self._startup_notify_task.cancel()
+                    await asyncio.gather(self._startup_notify_task, return_exceptions=True)
+                await self.cancel_pending_deletes()
+                await self.wait_for_cache_stores()
+                await self.close_http_session()
+                stop_queue_logging()
+
+            # Add lifecycle hooks
             self.application.post_init = post_init
+            self.application.post_shutdown = post_shutdown
             
+            # Skip updates queued while the bot was offline unless replay is requested
+            replay_pending = os.getenv('REPLAY_PENDING', 'false').lower() == 'true'
+
             # Run polling - this handles all the async setup and cleanup automatically
+            # Long-poll for up to 30s per getUpdates call so an idle bot makes few requests
             self.application.run_polling(
-                drop_pending_updates=False,
+                timeout=30,
+                poll_interval=0.0,
+                drop_pending_updates=not replay_pending,
                 allowed_updates=['message', 'callback_query'],
                 close_loop=False
             )
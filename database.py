@@ -11,7 +11,7 @@ from datetime import datetime
 from typing import Dict, List, Optional, Set
 from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, BigInteger, String, Text, DateTime, JSON
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -123,6 +123,27 @@ class DatabaseManager:
                 session.close()
             return False
 
+    def add_users(self, user_ids: List[int]) -> bool:
+        """Add many users in a single INSERT, skipping ones that already exist"""
+        if not self.enabled:
+            return False
+        if not user_ids:
+            return True
+        
+        try:
+            session = self.Session()
+            stmt = pg_insert(User).values([{'user_id': user_id} for user_id in user_ids])
+            session.execute(stmt.on_conflict_do_nothing(index_elements=['user_id']))
+            session.commit()
+            session.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error adding {len(user_ids)} users: {e}")
+            if 'session' in locals():
+                session.rollback()
+                session.close()
+            return False
+
     def remove_user(self, user_id: int) -> bool:
         """Remove a user from the database"""
         if not self.enabled:
@@ -184,6 +205,29 @@ class DatabaseManager:
                 session.close()
             return []
 
+    def get_users_page(self, offset: int = 0, limit: int = 20) -> List[Dict]:
+        """Get one page of users with their full data, ordered by user ID"""
+        if not self.enabled:
+            return []
+        
+        try:
+            session = self.Session()
+            users = session.query(User).order_by(User.user_id).offset(offset).limit(limit).all()
+            users_data = [{
+                'user_id': user.user_id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'added_at': user.added_at
+            } for user in users]
+            session.close()
+            return users_data
+        except Exception as e:
+            logger.error(f"Error fetching users page at offset {offset}: {e}")
+            if 'session' in locals():
+                session.close()
+            return []
+
     def get_user_count(self) -> int:
         """Get total number of users"""
         if not self.enabled:
@@ -324,9 +368,8 @@ class DatabaseManager:
                 with open(users_file, 'r') as f:
                     user_ids = json.load(f)
                     
-                for user_id in user_ids:
-                    if not self.add_user(user_id):
-                        success = False
+                if not self.add_users(user_ids):
+                    success = False
                         
                 logger.info(f"Migrated {len(user_ids)} users from {users_file}")
             except Exception as e:
@@ -6,15 +6,17 @@ Can be run independently or imported by other scripts
 """
 
 import os
-import json
+import orjson
 import logging
 import msal
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
 import asyncio
+import time
 import aiohttp
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Callable
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
 from dotenv import load_dotenv
 
 # Import database manager for persistent storage
@@ -43,6 +45,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Keep-alive pool and (connect, read) timeout for the synchronous Graph calls
+GRAPH_POOL_SIZE = 10
+GRAPH_SYNC_TIMEOUT = (5, 30)
+
+# Graph pre-authenticated download URLs live about an hour; trust them for 45 minutes
+DOWNLOAD_URL_TTL = 45 * 60
+
 class OneDriveIndexer:
     def __init__(self, target_folders=None, folder_config=None):
         """Initialize the OneDrive indexer with Azure credentials and folder configuration"""
@@ -98,6 +107,10 @@ class OneDriveIndexer:
             logger.error(f"❌ Failed to initialize MSAL application: {e}")
             raise
         
+        # Pooled session for synchronous Graph calls, so folder walks reuse one TLS connection
+        self.http = requests.Session()
+        self.http.mount("https://", HTTPAdapter(pool_connections=GRAPH_POOL_SIZE, pool_maxsize=GRAPH_POOL_SIZE))
+        
         # File paths (fallback storage)
         self.index_file = 'file_index.json'
         self.timestamp_file = 'index_timestamp.txt'
@@ -108,8 +121,11 @@ class OneDriveIndexer:
         
         # Cache
         self.file_index = {}
+        self.search_entries = []  # (lowercased name, folder path, item) for search_files
+        self.id_index = {}  # item id -> (folder path, item)
+        self.index_totals = {'total_folders': 0, 'total_files': 0, 'total_size': 0}
         self.access_token = None
-        self.token_expires = None
+        self.token_expires = None  # time.monotonic() deadline
         
         # Stats
         self.total_folders = 0
@@ -139,7 +155,7 @@ class OneDriveIndexer:
 
     def get_access_token(self) -> Optional[str]:
         """Get valid access token for Microsoft Graph API"""
-        if self.access_token and self.token_expires and datetime.now() < self.token_expires:
+        if self.access_token and self.token_expires and time.monotonic() < self.token_expires:
             return self.access_token
             
         try:
@@ -147,7 +163,7 @@ class OneDriveIndexer:
             
             if "access_token" in result:
                 self.access_token = result["access_token"]
-                self.token_expires = datetime.now() + timedelta(seconds=result.get("expires_in", 3600) - 300)
+                self.token_expires = time.monotonic() + result.get("expires_in", 3600) - 300
                 logger.info("Access token acquired successfully")
                 return self.access_token
             else:
@@ -158,12 +174,12 @@ class OneDriveIndexer:
 
     async def get_access_token_async(self) -> Optional[str]:
         """Get valid access token for Microsoft Graph API (async version)"""
-        if self.access_token and self.token_expires and datetime.now() < self.token_expires:
+        if self.access_token and self.token_expires and time.monotonic() < self.token_expires:
             return self.access_token
             
         try:
             # Run token acquisition in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             result = await loop.run_in_executor(
                 None, 
                 lambda: self.app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
@@ -171,7 +187,7 @@ class OneDriveIndexer:
             
             if "access_token" in result:
                 self.access_token = result["access_token"]
-                self.token_expires = datetime.now() + timedelta(seconds=result.get("expires_in", 3600) - 300)
+                self.token_expires = time.monotonic() + result.get("expires_in", 3600) - 300
                 logger.info("Access token acquired successfully (async)")
                 return self.access_token
             else:
@@ -189,7 +205,7 @@ class OneDriveIndexer:
         try:
             headers = {"Authorization": f"Bearer {token}"}
             url = f"https://graph.microsoft.com/v1.0/users/{self.target_user_id}/drive/root/children"
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, headers=headers, timeout=GRAPH_SYNC_TIMEOUT)
             
             if response.status_code != 200:
                 logger.error(f"Error fetching root items: {response.text}")
@@ -314,7 +330,7 @@ class OneDriveIndexer:
             url = f"https://graph.microsoft.com/v1.0/users/{self.target_user_id}/drive/items/{folder_id}/children"
             
             logger.info(f"{'  ' * depth}Indexing: {path}")
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, headers=headers, timeout=GRAPH_SYNC_TIMEOUT)
             
             if response.status_code != 200:
                 logger.error(f"Error fetching folder contents for {path}: {response.text}")
@@ -338,6 +354,8 @@ class OneDriveIndexer:
                 
                 if 'file' in item:
                     item_info['download_url'] = item.get('@microsoft.graph.downloadUrl', '')
+                    # Wall-clock expiry, since the index is persisted and reloaded across restarts
+                    item_info['download_url_expires'] = time.time() + DOWNLOAD_URL_TTL
                     files_in_current.append(item)
                     self.total_files += 1
                     self.total_size += item.get('size', 0)
@@ -424,6 +442,8 @@ class OneDriveIndexer:
                 
                 if 'file' in item:
                     item_info['download_url'] = item.get('@microsoft.graph.downloadUrl', '')
+                    # Wall-clock expiry, since the index is persisted and reloaded across restarts
+                    item_info['download_url_expires'] = time.time() + DOWNLOAD_URL_TTL
                     files_in_current.append(item)
                     self.total_files += 1
                     self.total_size += item.get('size', 0)
@@ -517,7 +537,7 @@ class OneDriveIndexer:
         """Proactively refresh tokens to avoid delays during indexing"""
         try:
             # Check if token will expire soon (within 5 minutes)
-            if self.token_expires and (self.token_expires - datetime.now()).total_seconds() < 300:
+            if self.token_expires and self.token_expires - time.monotonic() < 300:
                 logger.info("Proactively refreshing access token...")
                 await self.get_access_token_async()
         except Exception as e:
@@ -595,7 +615,7 @@ class OneDriveIndexer:
         # For now, we'll use the first found folder as root for backward compatibility
         # In the future, this could be expanded to support multiple root folders
         primary_folder = target_folders[0]
-        self.file_index = {'root': primary_folder['id']}
+        self.file_index = {'root': []}
         
         logger.info(f"Using primary folder '{primary_folder['name']}' as root")
         
@@ -604,6 +624,7 @@ class OneDriveIndexer:
         
         if success:
             self.save_index()
+            self._build_lookup_tables()
             logger.info(f"✅ Index built successfully!")
             logger.info(f"📊 Total: {self.total_folders} folders, {self.total_files} files")
             logger.info(f"💾 Total size: {self.total_size / (1024*1024*1024):.2f} GB")
@@ -681,7 +702,7 @@ class OneDriveIndexer:
             
             # Initialize index with target folders
             primary_folder = target_folders[0]
-            self.file_index = {'root': primary_folder['id']}
+            self.file_index = {'root': []}
             
             logger.info(f"Using primary folder '{primary_folder['name']}' as root")
             
@@ -692,6 +713,7 @@ class OneDriveIndexer:
             
             if success:
                 self.save_index()
+                self._build_lookup_tables()
                 logger.info(f"✅ Index built successfully (async)!")
                 logger.info(f"📊 Total: {self.total_folders} folders, {self.total_files} files")
                 logger.info(f"💾 Total size: {self.total_size / (1024*1024*1024):.2f} GB")
@@ -763,6 +785,7 @@ class OneDriveIndexer:
                     cached_index = db_manager.get_cache(self.db_index_key)
                     if cached_index:
                         self.file_index = cached_index
+                        self._build_lookup_tables()
                         logger.info(f"✅ Loaded cached index from database ({len(self.file_index)} paths)")
                         return
                     else:
@@ -772,8 +795,8 @@ class OneDriveIndexer:
             
             # Fallback to file
             if os.path.exists(self.index_file):
-                with open(self.index_file, 'r') as f:
-                    self.file_index = json.load(f)
+                with open(self.index_file, 'rb') as f:
+                    self.file_index = orjson.loads(f.read())
                 logger.info(f"✅ Loaded cached index from file ({len(self.file_index)} paths)")
             else:
                 logger.info("No cached index file found")
@@ -781,6 +804,39 @@ class OneDriveIndexer:
         except Exception as e:
             logger.error(f"Error loading cached index: {e}")
             self.file_index = {}
+        
+        self._build_lookup_tables()
+
+    def _build_lookup_tables(self):
+        """Precompute lookup tables derived from file_index (call whenever the index is replaced)"""
+        # Enforce the schema once (folder path -> list of item dicts) so readers can skip type checks
+        normalized = {
+            path: [item for item in items if isinstance(item, dict)]
+            for path, items in self.file_index.items()
+            if isinstance(items, list)
+        }
+        if len(normalized) != len(self.file_index):
+            logger.warning(f"Dropped {len(self.file_index) - len(normalized)} malformed index entries")
+        self.file_index = normalized
+        
+        search_entries = []
+        id_index = {}
+        totals = {'total_folders': 0, 'total_files': 0, 'total_size': 0}
+        
+        for path, items in self.file_index.items():
+            for item in items:
+                search_entries.append((item.get('name', '').lower(), path, item))
+                if item.get('id'):
+                    id_index[item['id']] = (path, item)
+                if item.get('type') == 'file':
+                    totals['total_files'] += 1
+                    totals['total_size'] += item.get('size', 0)
+                elif item.get('type') == 'folder':
+                    totals['total_folders'] += 1
+        
+        self.search_entries = search_entries
+        self.id_index = id_index
+        self.index_totals = totals
 
     def save_index(self, append_mode=False):
         """Save index and timestamp to database with file fallback"""
@@ -802,8 +858,8 @@ class OneDriveIndexer:
                     # Fallback to file-based append
                     logger.info("Loading existing index from file for append mode...")
                     try:
-                        with open(self.index_file, 'r') as f:
-                            existing_index = json.load(f)
+                        with open(self.index_file, 'rb') as f:
+                            existing_index = orjson.loads(f.read())
                         
                         merged_index = existing_index.copy()
                         merged_index.update(self.file_index)
@@ -840,8 +896,8 @@ class OneDriveIndexer:
     def _save_index_to_file(self, timestamp):
         """Helper method to save index to files"""
         # Save index
-        with open(self.index_file, 'w') as f:
-            json.dump(self.file_index, f, indent=2)
+        with open(self.index_file, 'wb') as f:
+            f.write(orjson.dumps(self.file_index, option=orjson.OPT_INDENT_2))
         
         # Save timestamp
         with open(self.timestamp_file, 'w') as f:
@@ -849,6 +905,26 @@ class OneDriveIndexer:
             
         logger.debug(f"Index and timestamp saved to files")
 
+    def find_item(self, item_id: str) -> Optional[Tuple[str, Dict]]:
+        """Look up an indexed item by id, returning (folder path, item)"""
+        return self.id_index.get(item_id)
+
+    def get_cached_download_url(self, item_id: str) -> Optional[str]:
+        """Return the download URL captured at index time if it has not expired"""
+        entry = self.id_index.get(item_id)
+        if entry:
+            item = entry[1]
+            if item.get('download_url') and item.get('download_url_expires', 0) > time.time():
+                return item['download_url']
+        return None
+
+    def invalidate_download_url(self, item_id: str):
+        """Drop the download URL captured at index time, e.g. after Graph rejected it"""
+        entry = self.id_index.get(item_id)
+        if entry:
+            entry[1].pop('download_url', None)
+            entry[1].pop('download_url_expires', None)
+
     def get_folder_contents(self, path: str = 'root') -> List[Dict]:
         """Get folder contents from cached index"""
         return self.file_index.get(path, [])
@@ -857,9 +933,7 @@ class OneDriveIndexer:
         """Get indexing statistics"""
         stats = {
             'total_paths': len(self.file_index),
-            'total_folders': 0,
-            'total_files': 0,
-            'total_size': 0,
+            **self.index_totals,
             'last_updated': None
         }
         
@@ -880,16 +954,6 @@ class OneDriveIndexer:
                     timestamp = float(f.read().strip())
                     stats['last_updated'] = datetime.fromtimestamp(timestamp)
                     logger.debug("Got timestamp from file for stats")
-            
-            # Count files and folders from index
-            for path, items in self.file_index.items():
-                if isinstance(items, list):
-                    for item in items:
-                        if item.get('type') == 'file':
-                            stats['total_files'] += 1
-                            stats['total_size'] += item.get('size', 0)
-                        elif item.get('type') == 'folder':
-                            stats['total_folders'] += 1
                             
         except Exception as e:
             logger.error(f"Error calculating stats: {e}")
@@ -901,20 +965,16 @@ class OneDriveIndexer:
         results = []
         query_lower = query.lower()
         
-        for path, items in self.file_index.items():
-            if isinstance(items, list):
-                for item in items:
-                    if query_lower in item.get('name', '').lower():
-                        item_copy = item.copy()
-                        item_copy['folder_path'] = path
-                        results.append(item_copy)
+        for name_lower, path, item in self.search_entries:
+            if query_lower in name_lower:
+                item_copy = item.copy()
+                item_copy['folder_path'] = path
+                results.append(item_copy)
         
         return results
 
 def main():
     """Main function for running indexer independently"""
-    import argparse
-    
     parser = argparse.ArgumentParser(description='OneDrive File Indexer')
     parser.add_argument('--force', '-f', action='store_true', help='Force rebuild index')
     parser.add_argument('--stats', '-s', action='store_true', help='Show index statistics')